@@ -1,6 +1,27 @@
 from django.contrib import admin
+from django.db.models import DecimalField, F, Sum
 
-from .models import Cart, CartItem
+from ecommerce_api.core.paginator import ApproximateCountPaginator
+
+from .models import Cart, CartEventRollup, CartItem
+
+
+def recompute_cart_totals(cart_ids):
+    """
+    Reset the running totals of the given carts from their items. Staff
+    edits go around the cart API, which keeps the totals up to date.
+    """
+    for cart_id in set(cart_ids):
+        totals = CartItem.objects.filter(cart_id=cart_id).aggregate(
+            total=Sum(
+                F("price_snapshot") * F("quantity"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            count=Sum("quantity"),
+        )
+        Cart.objects.filter(pk=cart_id).update(
+            total_amount=totals["total"] or 0, item_count=totals["count"] or 0
+        )
 
 
 class CartItemInline(admin.TabularInline):
@@ -8,8 +29,13 @@ class CartItemInline(admin.TabularInline):
     extra = 0  # Do not show extra empty rows
     readonly_fields = ("price_snapshot", "subtotal", "added_at")
     fields = ("product", "quantity", "price_snapshot", "subtotal", "added_at")
+    raw_id_fields = ("product",)
     can_delete = True
 
+    def get_queryset(self, request):
+        # Product.__str__ shows the category name
+        return super().get_queryset(request).select_related("product__category")
+
     def subtotal(self, obj):
         return obj.subtotal
 
@@ -18,13 +44,26 @@ class CartItemInline(admin.TabularInline):
 class CartAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "is_active", "total", "created_at", "updated_at")
     list_filter = ("is_active", "created_at", "updated_at")
+    list_select_related = ("user",)
     search_fields = ("user__username",)
+    raw_id_fields = ("user",)
     inlines = [CartItemInline]
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
 
-    readonly_fields = ("total",)
+    # Derived from the items; recomputed below when staff edit them
+    exclude = ("total_amount",)
+    readonly_fields = ("total", "item_count")
 
+    # The stored running total, so the list needs no per-row SUM
+    @admin.display(description="Total", ordering="total_amount")
     def total(self, obj):
-        return obj.total
+        return obj.total_amount
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is CartItem:
+            recompute_cart_totals([form.instance.pk])
 
 
 @admin.register(CartItem)
@@ -39,8 +78,36 @@ class CartItemAdmin(admin.ModelAdmin):
         "added_at",
     )
     list_filter = ("added_at",)
+    # Cart.__str__ shows the user, Product.__str__ the category
+    list_select_related = ("cart__user", "product__category")
     search_fields = ("product__name", "cart__user__username")
+    raw_id_fields = ("cart", "product")
     readonly_fields = ("subtotal", "price_snapshot", "added_at")
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        previous_cart_id = form.initial.get("cart")
+        super().save_model(request, obj, form, change)
+        recompute_cart_totals(filter(None, [previous_cart_id, obj.cart_id]))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recompute_cart_totals([obj.cart_id])
+
+    def delete_queryset(self, request, queryset):
+        cart_ids = list(queryset.values_list("cart_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recompute_cart_totals(cart_ids)
+
+
+@admin.register(CartEventRollup)
+class CartEventRollupAdmin(admin.ModelAdmin):
+    list_display = ("hour", "event", "product_id", "count", "quantity")
+    list_filter = ("event", "hour")
+    search_fields = ("product_id",)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
 
 
 # Register your models here.
@@ -0,0 +1,221 @@
+"""
+Cart activity (add/update/remove/batch/merge/checkout) for funnel analytics.
+
+The request path only appends one entry to a capped Redis Stream (XADD with
+an approximate MAXLEN); roll_up_cart_events(), run by a Celery beat task,
+reads it in batches through a consumer group and adds the counts to hourly
+CartEventRollup rows with one bulk insert/update per batch.
+
+Entries: e=event, then either p=product_id and q=quantity, or for a batch
+l="op:product_id:quantity,..." (rolled up per op). Counting is at least
+once: a batch whose XACK is lost after the DB commit is counted again on
+the next run.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CartEventRollup
+from .redis_client import client_for
+
+logger = logging.getLogger(__name__)
+
+EVENTS_STREAM_KEY = "cart-events"
+ROLLUP_GROUP = "rollup"
+ROLLUP_CONSUMER = "rollup"
+ROLLUP_LOCK_KEY = "cart-events:rollup-lock"
+
+BATCH_OPS = {"add", "update", "remove"}
+
+
+# -------------------- RECORD --------------------
+def record_cart_event(event, product_id=None, quantity=0, lines=None):
+    """
+    Append one event to the stream. Never raises: analytics must not fail
+    a cart request.
+    """
+    if not settings.CART_EVENTS_ENABLED:
+        return
+    fields = {"e": event}
+    if lines:
+        fields["l"] = ",".join(f"{op}:{pid}:{qty}" for op, pid, qty in lines)
+    elif product_id:
+        fields["p"] = product_id
+        fields["q"] = quantity
+    try:
+        client_for(EVENTS_STREAM_KEY).xadd(
+            EVENTS_STREAM_KEY, fields, maxlen=settings.CART_EVENTS_MAXLEN, approximate=True
+        )
+    except redis.RedisError as exc:
+        logger.warning(f"Could not record cart event {event}: {exc}")
+
+
+def records_cart_event(event):
+    """
+    Record `event` for every successful (2xx) response of a cart view method.
+    Apply it under @idempotent so replayed responses are not counted again.
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            response = view_method(self, request, *args, **kwargs)
+            if 200 <= response.status_code < 300:
+                data = request.data
+                lines = None
+                if event == "batch":
+                    # Same default as CartOperationSerializer; removals move no units
+                    lines = [
+                        (
+                            op.get("op"),
+                            op.get("product_id"),
+                            0 if op.get("op") == "remove" else op.get("quantity") or 1,
+                        )
+                        for op in data.get("operations", [])
+                    ]
+                record_cart_event(
+                    event,
+                    product_id=data.get("product_id"),
+                    quantity=data.get("quantity") or (1 if event == "add" else 0),
+                    lines=lines,
+                )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# -------------------- ROLL UP --------------------
+def _str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _decode(entries):
+    """
+    Stream entries as str, whatever the client's decode_responses setting.
+    """
+    return [
+        (_str(entry_id), {_str(k): _str(v) for k, v in (fields or {}).items()})
+        for entry_id, fields in entries
+    ]
+
+
+def _hour(entry_id):
+    # Stream ids start with the server time in milliseconds
+    ms = int(entry_id.split("-")[0])
+    return datetime.fromtimestamp(ms // 3_600_000 * 3600, tz=dt_timezone.utc)
+
+
+def _to_int(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _aggregate(entries):
+    """
+    {(hour, event, product_id): [events, units]} for a list of stream entries.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for entry_id, fields in entries:
+        if not fields:  # trimmed from the stream before it was read
+            continue
+        hour = _hour(entry_id)
+        if fields.get("l"):
+            for line in fields["l"].split(","):
+                op, _, rest = line.partition(":")
+                pid, _, qty = rest.rpartition(":")
+                if op in BATCH_OPS:
+                    row = totals[(hour, op, pid)]
+                    row[0] += 1
+                    row[1] += _to_int(qty)
+        else:
+            row = totals[(hour, fields.get("e", ""), fields.get("p", ""))]
+            row[0] += 1
+            row[1] += _to_int(fields.get("q"))
+    return totals
+
+
+@transaction.atomic
+def _store_rollups(totals):
+    """
+    Add `totals` to the rollup rows: one SELECT ... FOR UPDATE for the rows
+    that exist, then one bulk_update and one bulk_create.
+    """
+    if not totals:
+        return
+    hours, events, product_ids = (set(column) for column in zip(*totals))
+    existing = {
+        (row.hour, row.event, row.product_id): row
+        for row in CartEventRollup.objects.select_for_update().filter(
+            hour__in=hours, event__in=events, product_id__in=product_ids
+        )
+    }
+
+    changed, new = [], []
+    for key, (count, quantity) in totals.items():
+        row = existing.get(key)
+        if row:
+            row.count += count
+            row.quantity += quantity
+            changed.append(row)
+        else:
+            hour, event, product_id = key
+            new.append(
+                CartEventRollup(
+                    hour=hour, event=event, product_id=product_id, count=count, quantity=quantity
+                )
+            )
+    CartEventRollup.objects.bulk_update(changed, ["count", "quantity"])
+    CartEventRollup.objects.bulk_create(new)
+
+
+def _ensure_group(client):
+    try:
+        client.xgroup_create(EVENTS_STREAM_KEY, ROLLUP_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+def roll_up_cart_events(batch_size=1000, max_batches=20):
+    """
+    Move up to max_batches * batch_size stream entries into the hourly
+    rollups. Entries left unacknowledged by a failed run are read first.
+    Returns the number of entries processed.
+    """
+    # Overlapping runs would read the same pending entries twice
+    if not cache.add(ROLLUP_LOCK_KEY, 1, timeout=600):
+        return 0
+
+    try:
+        client = client_for(EVENTS_STREAM_KEY)
+        _ensure_group(client)
+        processed = 0
+        start = "0"  # our pending entries first, then new ones (">")
+        for _ in range(max_batches):
+            reply = client.xreadgroup(
+                ROLLUP_GROUP, ROLLUP_CONSUMER, {EVENTS_STREAM_KEY: start}, count=batch_size
+            )
+            entries = _decode(reply[0][1]) if reply else []
+            if not entries:
+                if start == ">":
+                    break
+                start = ">"
+                continue
+
+            _store_rollups(_aggregate(entries))
+            client.xack(EVENTS_STREAM_KEY, ROLLUP_GROUP, *[entry_id for entry_id, _ in entries])
+            processed += len(entries)
+        return processed
+    finally:
+        cache.delete(ROLLUP_LOCK_KEY)
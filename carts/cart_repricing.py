@@ -0,0 +1,86 @@
+"""
+Keep cart price snapshots in step with product prices.
+
+Saving a product with a new price enqueues carts.celery_tasks.
+reprice_product_carts (see carts/signals.py), which walks the product's
+reverse index in Redis (product -> cart keys, maintained by redis_cart on
+every write that adds a product) and reprices the carts in pipelined
+batches. Repriced user carts are written to Postgres in one bulk flush per
+batch, and DB carts that are no longer in Redis are fixed with two UPDATEs.
+"""
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from product.models import Product
+
+from .cart_sync import USER_KEY_PREFIX, flush_carts_to_db
+from .models import Cart, CartItem
+from .redis_cart import reprice_carts, scan_product_carts, unindex_carts
+
+
+def reprice_product(product_id, batch_size=500):
+    """
+    Bring every cart holding `product_id` to its current price.
+    Returns the number of Redis carts repriced.
+    """
+    price = Product.objects.filter(id=product_id).values_list("price", flat=True).first()
+    if price is None:
+        return 0
+
+    repriced = 0
+    cursor = 0
+    while True:
+        cursor, keys = scan_product_carts(product_id, cursor, count=batch_size)
+        if keys:
+            results = reprice_carts(keys, product_id, price)
+            unindex_carts(product_id, [key for key, result in results.items() if result < 0])
+
+            changed = [key for key, result in results.items() if result > 0]
+            user_ids = [
+                key[len(USER_KEY_PREFIX):] for key in changed if key.startswith(USER_KEY_PREFIX)
+            ]
+            if user_ids:
+                flush_carts_to_db(user_ids)
+            repriced += len(changed)
+        if cursor == 0:
+            break
+
+    reprice_db_carts(product_id, price)
+    return repriced
+
+
+@transaction.atomic
+def reprice_db_carts(product_id, price):
+    """
+    Active DB carts still holding an old price for the product (e.g. their
+    Redis copy expired): update the lines, then recompute those carts' totals.
+    Returns the number of carts changed.
+    """
+    cart_ids = list(
+        CartItem.objects.filter(product_id=product_id, cart__is_active=True)
+        .exclude(price_snapshot=price)
+        .values_list("cart_id", flat=True)
+    )
+    if not cart_ids:
+        return 0
+
+    CartItem.objects.filter(product_id=product_id, cart_id__in=cart_ids).update(
+        price_snapshot=price
+    )
+    line_totals = (
+        CartItem.objects.filter(cart=OuterRef("pk"))
+        .values("cart")
+        .annotate(
+            total=Sum(
+                F("price_snapshot") * F("quantity"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .values("total")
+    )
+    Cart.objects.filter(id__in=cart_ids).update(
+        total_amount=Subquery(line_totals), updated_at=timezone.now()
+    )
+    return len(cart_ids)
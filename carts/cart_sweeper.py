@@ -0,0 +1,180 @@
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .cart_sync import USER_KEY_PREFIX
+from .guest_tokens import GUEST_KEY_PREFIX
+from .models import Cart, CartItem
+from .redis_cart import (
+    CART_TTL,
+    delete_carts,
+    expire_carts,
+    get_cart_ttls,
+    get_sweep_cursor,
+    scan_carts,
+    set_sweep_cursor,
+)
+
+CACHE_SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# -------------------- INACTIVE DB CARTS --------------------
+def purge_inactive_carts(older_than, batch_size=500, delete_batch_size=200, max_batches=20):
+    """
+    Delete inactive carts (and their items) last touched before `older_than`.
+
+    Carts are walked in primary key order (keyset, no OFFSET) `batch_size` at
+    a time, and every DELETE covers at most `delete_batch_size` rows in its
+    own short transaction so carts_cartitem is never locked for long.
+    Orders keep their own items; their `cart` link is set to NULL.
+    Returns (carts_deleted, items_deleted).
+    """
+    carts_deleted = items_deleted = 0
+    last_id = ""
+
+    for _ in range(max_batches):
+        cart_ids = list(
+            Cart.objects.filter(is_active=False, updated_at__lt=older_than, id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not cart_ids:
+            break
+        last_id = cart_ids[-1]
+
+        while True:
+            item_ids = list(
+                CartItem.objects.filter(cart_id__in=cart_ids).values_list("id", flat=True)[
+                    :delete_batch_size
+                ]
+            )
+            if not item_ids:
+                break
+            items_deleted += CartItem.objects.filter(id__in=item_ids).delete()[0]
+
+        for chunk in _chunks(cart_ids, delete_batch_size):
+            carts_deleted += Cart.objects.filter(id__in=chunk).delete()[1].get(
+                Cart._meta.label, 0
+            )
+
+        if len(cart_ids) < batch_size:
+            break
+
+    return carts_deleted, items_deleted
+
+
+# -------------------- ABANDONED CART METRICS --------------------
+def abandoned_cart_stats(idle_since):
+    """
+    Active carts with items that nobody touched since `idle_since`.
+    One aggregate query. Returns {"abandoned_carts", "abandoned_items", "abandoned_value"}.
+    """
+    stats = Cart.objects.filter(
+        is_active=True, item_count__gt=0, updated_at__lt=idle_since
+    ).aggregate(
+        abandoned_carts=Count("id"),
+        abandoned_items=Sum("item_count"),
+        abandoned_value=Sum("total_amount"),
+    )
+    return {
+        "abandoned_carts": stats["abandoned_carts"],
+        "abandoned_items": stats["abandoned_items"] or 0,
+        "abandoned_value": float(stats["abandoned_value"] or 0),
+    }
+
+
+# -------------------- REDIS CARTS --------------------
+def _live_sessions(session_keys):
+    """
+    The subset of `session_keys` that still has a session.
+    With the cache session backend this is one get_many() call.
+    """
+    if not session_keys:
+        return set()
+
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if settings.SESSION_ENGINE == CACHE_SESSION_ENGINE:
+        prefix = store.cache_key_prefix
+        found = caches[settings.SESSION_CACHE_ALIAS].get_many(
+            [prefix + key for key in session_keys]
+        )
+        return {key[len(prefix):] for key in found}
+    return {key for key in session_keys if store().exists(key)}
+
+
+def sweep_redis_carts(max_keys=10000, scan_count=1000, ttl=CART_TTL):
+    """
+    Walk the cart keys with SCAN, at most `max_keys` per call, resuming
+    where the previous call stopped.
+
+    - session guest carts whose session is gone are deleted (nobody can reach them)
+    - carts without an expiry (e.g. written by an old release) get the TTL
+    Returns counters for the keys seen.
+    """
+    stats = {
+        "scanned": 0,
+        "guest_carts": 0,
+        "user_carts": 0,
+        "orphaned_deleted": 0,
+        "ttl_restored": 0,
+    }
+    cursor = get_sweep_cursor()
+
+    while stats["scanned"] < max_keys:
+        cursor, keys = scan_carts(cursor, count=scan_count)
+        stats["scanned"] += len(keys)
+
+        guest_keys = [key for key in keys if not key.startswith(USER_KEY_PREFIX)]
+        stats["guest_carts"] += len(guest_keys)
+        stats["user_carts"] += len(keys) - len(guest_keys)
+
+        # Token guest carts have no session; they just expire
+        session_keys = [key for key in guest_keys if not key.startswith(GUEST_KEY_PREFIX)]
+        orphaned = set(session_keys) - _live_sessions(session_keys)
+        delete_carts(orphaned)
+        stats["orphaned_deleted"] += len(orphaned)
+
+        no_expiry = [
+            key for key, remaining in get_cart_ttls(set(keys) - orphaned).items() if remaining == -1
+        ]
+        expire_carts(no_expiry, ttl)
+        stats["ttl_restored"] += len(no_expiry)
+
+        if cursor == 0:
+            break
+
+    set_sweep_cursor(cursor)
+    return stats
+
+
+def sweep_carts():
+    """
+    One sweeper run: Redis keyspace pass, inactive DB cart purge and
+    abandoned-cart metrics. Returns all counters in one dict.
+    """
+    now = timezone.now()
+    stats = sweep_redis_carts(
+        max_keys=settings.CART_SWEEP_MAX_KEYS, scan_count=settings.CART_SWEEP_SCAN_COUNT
+    )
+
+    carts_deleted, items_deleted = purge_inactive_carts(
+        now - timedelta(days=settings.CART_INACTIVE_RETENTION_DAYS),
+        batch_size=settings.CART_SWEEP_BATCH_SIZE,
+        delete_batch_size=settings.CART_SWEEP_DELETE_BATCH_SIZE,
+    )
+    stats["inactive_carts_deleted"] = carts_deleted
+    stats["inactive_items_deleted"] = items_deleted
+
+    stats.update(
+        abandoned_cart_stats(now - timedelta(hours=settings.CART_ABANDONED_AFTER_HOURS))
+    )
+    return stats
@@ -0,0 +1,200 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from product.models import Product
+
+from .models import Cart, CartItem
+from .redis_cart import (
+    CartData,
+    clear_cart,
+    get_cart,
+    get_carts,
+    is_cart_dirty,
+    mark_carts_dirty,
+    save_cart,
+    unmark_cart_dirty,
+)
+
+USER_KEY_PREFIX = "user:"
+
+
+def user_cart_key(user_id):
+    return f"{USER_KEY_PREFIX}{user_id}"
+
+
+def _to_decimal(price):
+    return Decimal(str(price)).quantize(Decimal("0.01"))
+
+
+def store_cart_totals(cart_id, cart_data):
+    """
+    Copy the running totals of a Redis cart onto its DB cart.
+    """
+    Cart.objects.filter(pk=cart_id).update(
+        total_amount=_to_decimal(cart_data.total),
+        item_count=cart_data.item_count,
+        updated_at=timezone.now(),
+    )
+
+
+def discard_user_cart(user_id):
+    """
+    Drop the user's Redis cart and its dirty mark. Call it whenever the DB
+    cart is closed (e.g. by checkout): Redis must never outlive it, or the
+    next read, write or flush would bring the old lines back.
+    """
+    key = user_cart_key(user_id)
+    clear_cart(key)
+    unmark_cart_dirty(key)
+
+
+# -------------------- LOAD USER CART --------------------
+def load_user_cart(user):
+    """
+    Return the user's Redis cart, rebuilding it from the active DB cart
+    when Redis has nothing (e.g. after the TTL expired). Never writes to the
+    DB: without an active DB cart (or items in it) the cart is just empty.
+
+    A Redis cart is trusted without looking at the DB: every path that
+    closes a DB cart (checkout, removing its last item, a flush that empties
+    it) also drops or empties the Redis cart (see discard_user_cart).
+    """
+    key = user_cart_key(user.id)
+    cached_cart = get_cart(key)
+    if cached_cart:
+        return cached_cart
+
+    if settings.CART_WRITE_BEHIND and is_cart_dirty(key):
+        # Emptied in Redis and not flushed yet; the DB copy is stale
+        return CartData()
+
+    cart_data = {
+        str(i.product_id): {
+            "quantity": i.quantity,
+            "price_snapshot": float(i.price_snapshot),
+            "subtotal": float(i.subtotal),
+        }
+        for i in CartItem.objects.filter(cart__user=user, cart__is_active=True)
+    }
+    if not cart_data:
+        return CartData()
+    return save_cart(key, cart_data)
+
+
+# -------------------- FLUSH REDIS CARTS TO POSTGRES --------------------
+def flush_carts_to_db(user_ids):
+    """
+    Write the Redis carts of the given users back to their active DB carts.
+
+    Redis is the source of truth: DB items are created, updated or deleted so
+    the DB cart mirrors Redis exactly. The whole batch costs a fixed number of
+    queries (one read per table, one bulk_create / bulk_update / delete each)
+    no matter how many carts or items it contains.
+    Returns the number of carts written.
+    """
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    if not user_ids:
+        return 0
+
+    redis_carts = {
+        key[len(USER_KEY_PREFIX):]: cart
+        for key, cart in get_carts(user_cart_key(uid) for uid in user_ids).items()
+    }
+
+    # Skip products that have been deleted since they were added
+    product_ids = {pid for cart in redis_carts.values() for pid in cart}
+    valid_products = set(
+        Product.objects.filter(id__in=product_ids).values_list("id", flat=True)
+    )
+
+    now = timezone.now()
+    with transaction.atomic():
+        carts = {}
+        # Lock in primary key order so concurrent flushes cannot deadlock
+        for cart in (
+            Cart.objects.select_for_update()
+            .filter(user_id__in=user_ids, is_active=True)
+            .order_by("id")
+        ):
+            carts.setdefault(cart.user_id, cart)
+
+        new_carts = [
+            Cart(user_id=uid)
+            for uid in user_ids
+            if uid not in carts and redis_carts.get(uid)
+        ]
+        Cart.objects.bulk_create(new_carts)
+        for cart in new_carts:
+            carts[cart.user_id] = cart
+
+        existing = {}
+        for item in CartItem.objects.filter(cart__in=list(carts.values())):
+            existing[(item.cart_id, item.product_id)] = item
+
+        to_create, to_update, emptied = [], [], []
+        for uid, cart in carts.items():
+            lines = {
+                pid: line
+                for pid, line in redis_carts.get(uid, {}).items()
+                if pid in valid_products
+            }
+            if not lines:
+                emptied.append(cart.id)
+            cart.updated_at = now
+            cart.item_count = sum(line["quantity"] for line in lines.values())
+            cart.total_amount = sum(
+                (_to_decimal(line["price_snapshot"]) * line["quantity"] for line in lines.values()),
+                Decimal("0"),
+            )
+
+            for pid, line in lines.items():
+                price = _to_decimal(line["price_snapshot"])
+                item = existing.pop((cart.id, pid), None)
+                if item is None:
+                    to_create.append(
+                        CartItem(
+                            cart=cart,
+                            product_id=pid,
+                            quantity=line["quantity"],
+                            price_snapshot=price,
+                        )
+                    )
+                elif item.quantity != line["quantity"] or item.price_snapshot != price:
+                    item.quantity = line["quantity"]
+                    item.price_snapshot = price
+                    to_update.append(item)
+
+        # Whatever is left in `existing` is no longer in Redis
+        if existing:
+            CartItem.objects.filter(
+                id__in=[item.id for item in existing.values()]
+            ).delete()
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity", "price_snapshot"])
+        # bulk_update/update skip auto_now, so updated_at is set by hand
+        Cart.objects.bulk_update(
+            list(carts.values()), ["total_amount", "item_count", "updated_at"]
+        )
+        if emptied:
+            # Same rule as the synchronous remove_item path
+            Cart.objects.filter(id__in=emptied).update(is_active=False, updated_at=now)
+
+    return len(carts)
+
+
+def flush_user_cart(user_id):
+    """
+    Flush one user's cart right away (e.g. before checkout reads the DB cart).
+    """
+    key = user_cart_key(user_id)
+    unmark_cart_dirty(key)
+    try:
+        flush_carts_to_db([user_id])
+    except Exception:
+        mark_carts_dirty([key])
+        raise
@@ -1,12 +1,19 @@
 import logging
+from collections import defaultdict
 
 from celery import shared_task
-from django.core.mail import send_mail
+from django.conf import settings
 from django.db import transaction
 
-from carts.redis_cart import clear_cart
+from carts import cart_sweeper
+from carts.cart_events import roll_up_cart_events
+from carts.cart_repricing import reprice_product
+from carts.cart_sync import USER_KEY_PREFIX, flush_carts_to_db, flush_user_cart
+from carts.redis_cart import mark_carts_dirty, pop_dirty_carts
+from carts.stock_reservations import reconcile_stock, release_expired_reservations
 from orders.models import Order
-from product.models import Product
+from orders.outbox import publish as publish_side_effects
+from product.services.stock import decrement_stock
 
 logger = logging.getLogger(__name__)
 
@@ -39,26 +46,28 @@ def process_order_after_payment(self, order_id, user_email=None, user_id=None):
 
     try:
         with transaction.atomic():
-            #  Lock products & reduce stock
+            #  Lock products (in id order) & reduce stock, two statements in all
+            quantities = defaultdict(int)
             for item in order_items:
-                product = Product.objects.select_for_update().get(id=item.product.id)
-                if product.stock < item.quantity:
-                    raise ValueError(f"Insufficient stock for {product.name}")
-
-                product.stock -= item.quantity
-                product.save(update_fields=["stock"])
-
-            #  Clear cart
-            if user_id:
-                clear_cart(f"user:{user_id}")
+                if item.product_id:  # deleted products have no stock left to take
+                    quantities[item.product_id] += item.quantity
+            short = decrement_stock(quantities)
+            if short:
+                names = ", ".join(i.product.name for i in order_items if i.product_id in short)
+                raise ValueError(f"Insufficient stock for {names}")
 
             #  Update order business status
             order.status = "processing"
             order.is_processed = True
             order.save(update_fields=["status", "is_processed"])
 
-            # Send email notification
+            # Everything outside Postgres goes through the outbox: it only
+            # happens if this commits, and no row lock waits on Redis or SMTP.
+            # The Redis hold taken at checkout is now sold stock. (The cart
+            # itself was cleared at checkout; whatever is in it now is newer.)
+            side_effects = [("commit_stock", {"hold_id": order.id})]
 
+            # Send email notification
             if user_email:
                 currency_symbol = (
                     "₦" if getattr(order, "currency", "NGN").upper() == "NGN" else "$"
@@ -99,16 +108,125 @@ A follow-up email will be sent when your shipment is created with tracking detai
 
 Thank you for your purchase!
 """
-                send_mail(
-                    subject=f"Payment Successful - Order {order.id}",
-                    message=message,
-                    from_email="no-reply@shop.com",
-                    recipient_list=[user_email],
-                    fail_silently=True,
+                side_effects.append(
+                    (
+                        "send_mail",
+                        {
+                            "subject": f"Payment Successful - Order {order.id}",
+                            "message": message,
+                            "recipient_list": [user_email],
+                        },
+                    )
                 )
 
+            publish_side_effects(side_effects)
+
         logger.info(f"Order {order.id} processed successfully.")
 
     except Exception as exc:
         logger.error(f"Order {order.id} failed: {exc}")
         raise self.retry(exc=exc, countdown=10)
+
+
+@shared_task
+def flush_dirty_carts(batch_size=None, max_batches=50):
+    """
+    Write-behind flush: move carts changed in Redis into Postgres in batches.
+    Carts of a batch that fails are put back on the dirty set.
+    """
+    batch_size = batch_size or settings.CART_FLUSH_BATCH_SIZE
+    flushed = 0
+
+    for _ in range(max_batches):
+        keys = pop_dirty_carts(batch_size)
+        if not keys:
+            break
+
+        user_ids = [
+            key[len(USER_KEY_PREFIX):] for key in keys if key.startswith(USER_KEY_PREFIX)
+        ]
+        try:
+            flushed += flush_carts_to_db(user_ids)
+        except Exception as exc:
+            mark_carts_dirty(keys)
+            logger.error(f"Cart flush failed for {len(keys)} carts: {exc}")
+            raise
+
+        if len(keys) < batch_size:
+            break
+
+    if flushed:
+        logger.info(f"Flushed {flushed} carts to the database.")
+    return flushed
+
+
+@shared_task(bind=True, max_retries=3)
+def sync_user_cart(self, user_id):
+    """
+    Write one user's Redis cart to Postgres (e.g. right after a cart merge).
+    """
+    try:
+        flush_user_cart(user_id)
+    except Exception as exc:
+        logger.error(f"Cart sync for user {user_id} failed: {exc}")
+        raise self.retry(exc=exc, countdown=10)
+
+
+@shared_task
+def sweep_carts():
+    """
+    Periodic cart housekeeping; see carts.cart_sweeper.sweep_carts.
+    """
+    stats = cart_sweeper.sweep_carts()
+    logger.info(
+        "Cart sweep: "
+        + ", ".join(f"{name}={value}" for name, value in stats.items())
+    )
+    return stats
+
+
+@shared_task
+def release_expired_stock():
+    """
+    Give back stock held by checkouts whose payment never completed.
+    """
+    released = release_expired_reservations()
+    if released:
+        logger.info(f"Released {released} expired stock reservations.")
+    return released
+
+
+@shared_task
+def reconcile_stock_counters():
+    """
+    Re-align the Redis stock counters with Postgres.
+    """
+    synced = reconcile_stock()
+    logger.info(f"Reconciled {synced} stock counters.")
+    return synced
+
+
+@shared_task(bind=True, max_retries=3)
+def reprice_product_carts(self, product_id):
+    """
+    A product's price changed: update the price snapshot in every cart
+    holding it (see carts.cart_repricing).
+    """
+    try:
+        repriced = reprice_product(product_id, batch_size=settings.CART_REPRICE_BATCH_SIZE)
+    except Exception as exc:
+        logger.error(f"Repricing carts for product {product_id} failed: {exc}")
+        raise self.retry(exc=exc, countdown=10)
+    logger.info(f"Repriced {repriced} carts for product {product_id}.")
+    return repriced
+
+
+@shared_task
+def roll_up_cart_events_task():
+    """
+    Move cart events from the Redis stream into the hourly rollups.
+    """
+    processed = roll_up_cart_events(batch_size=settings.CART_EVENTS_BATCH_SIZE)
+    if processed:
+        logger.info(f"Rolled up {processed} cart events.")
+    return processed
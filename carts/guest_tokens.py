@@ -0,0 +1,55 @@
+"""
+Stateless guest cart tokens (settings.GUEST_CART_TOKENS).
+
+Instead of creating a Django session for every anonymous visitor, a guest
+cart is identified by a signed token holding its cart key, sent back by the
+client in the X-Cart-Token header or the cart_token cookie. Nothing is
+stored server side until the first write: reads without a token see an
+empty cart, and the token is only issued by a successful write.
+"""
+
+import shortuuid
+from django.conf import settings
+from django.core import signing
+
+GUEST_KEY_PREFIX = "guest:"
+GUEST_TOKEN_HEADER = "X-Cart-Token"
+
+_signer = signing.Signer(salt="carts.guest-cart-token")
+
+
+def new_guest_cart_key():
+    return f"{GUEST_KEY_PREFIX}{shortuuid.uuid()}"
+
+
+def guest_cart_key_from_request(request):
+    """
+    Cart key carried by the request's guest token, or None if there is no
+    token or its signature does not check out.
+    """
+    token = request.headers.get(GUEST_TOKEN_HEADER) or request.COOKIES.get(
+        settings.GUEST_CART_COOKIE_NAME
+    )
+    if not token:
+        return None
+    try:
+        key = _signer.unsign(token)
+    except signing.BadSignature:
+        return None
+    return key if key.startswith(GUEST_KEY_PREFIX) else None
+
+
+def set_guest_cart_token(response, key):
+    """
+    Hand the token for `key` to the client, as a header and a cookie.
+    """
+    token = _signer.sign(key)
+    response[GUEST_TOKEN_HEADER] = token
+    response.set_cookie(
+        settings.GUEST_CART_COOKIE_NAME,
+        token,
+        max_age=settings.GUEST_CART_COOKIE_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
@@ -0,0 +1,159 @@
+import json
+import time
+
+import msgpack
+import shortuuid
+from django.core.management.base import BaseCommand
+
+from carts.redis_cart import CART_FORMAT_VERSION, _decode_cart, _get_script, to_minor_units
+from carts.redis_client import client_for, group_by_client
+
+# Outside the cart:* namespace, so the sweeper, the dirty set and the
+# product reverse index never see benchmark carts
+BENCH_PREFIX = "cart-bench:"
+BENCH_TTL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the compact cart format with the old JSON string carts: "
+        "Redis memory per cart and encode/decode cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--carts", type=int, default=1000)
+        parser.add_argument("--lines", type=int, default=5, help="Items per cart")
+
+    def handle(self, *args, **options):
+        carts = [self.make_cart(options["lines"]) for _ in range(options["carts"])]
+        run = shortuuid.uuid()
+        json_keys = [f"{BENCH_PREFIX}{run}:json:{i}" for i in range(len(carts))]
+        compact_keys = [
+            f"{BENCH_PREFIX}{run}:v{CART_FORMAT_VERSION}:{i}" for i in range(len(carts))
+        ]
+
+        try:
+            self.compare_codecs(carts)
+            self.compare_redis(carts, json_keys, compact_keys)
+        finally:
+            # Only the keys this run wrote
+            for client, keys in group_by_client(json_keys + compact_keys):
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.delete(key)
+                pipe.execute()
+
+    # ------------------- SAMPLE DATA -------------------
+    def make_cart(self, lines):
+        cart = {}
+        for i in range(lines):
+            price = round(499.99 + i * 1250.5, 2)
+            quantity = i % 3 + 1
+            cart[shortuuid.uuid()] = {
+                "quantity": quantity,
+                "price_snapshot": price,
+                "subtotal": quantity * price,
+            }
+        return cart
+
+    # ------------------- ENCODE / DECODE -------------------
+    def compare_codecs(self, carts):
+        """
+        Client-side cost of the old JSON value against the msgpack line
+        values of the new format (packed/unpacked in Lua in production).
+        """
+        start = time.perf_counter()
+        encoded = [json.dumps(cart) for cart in carts]
+        json_encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for value in encoded:
+            json.loads(value)
+        json_decode = time.perf_counter() - start
+        json_bytes = sum(len(value) for value in encoded)
+
+        start = time.perf_counter()
+        packed = [
+            {
+                pid: msgpack.packb([item["quantity"], round(item["price_snapshot"] * 100)])
+                for pid, item in cart.items()
+            }
+            for cart in carts
+        ]
+        pack_encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for cart in packed:
+            for value in cart.values():
+                msgpack.unpackb(value)
+        pack_decode = time.perf_counter() - start
+        pack_bytes = sum(len(pid) + len(value) for cart in packed for pid, value in cart.items())
+
+        self.stdout.write(f"Codec ({len(carts)} carts)")
+        steps = ("encode", "decode")
+        self.report(
+            "json", json_bytes / len(carts), json_encode, json_decode, len(carts), steps
+        )
+        self.report(
+            f"msgpack v{CART_FORMAT_VERSION}",
+            pack_bytes / len(carts),
+            pack_encode,
+            pack_decode,
+            len(carts),
+            steps,
+        )
+
+    # ------------------- REDIS -------------------
+    def compare_redis(self, carts, json_keys, compact_keys):
+        """
+        Memory per cart as reported by MEMORY USAGE, and the time to write
+        and read every cart through each path. Compact carts are written and
+        read with the production SAVE_CART / GET_CART scripts, but straight
+        to the benchmark keys: no reverse index or dirty set is touched.
+        """
+        start = time.perf_counter()
+        for key, cart in zip(json_keys, carts):
+            client_for(key).set(key, json.dumps(cart), ex=BENCH_TTL)
+        json_write = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in json_keys:
+            json.loads(client_for(key).get(key))
+        json_read = time.perf_counter() - start
+
+        save_script, get_script = _get_script("SAVE_CART"), _get_script("GET_CART")
+        start = time.perf_counter()
+        for key, cart in zip(compact_keys, carts):
+            args = [BENCH_TTL]
+            for pid, item in cart.items():
+                args.extend([pid, item["quantity"], to_minor_units(item["price_snapshot"])])
+            save_script(keys=[key], args=args, client=client_for(key))
+        compact_write = time.perf_counter() - start
+        start = time.perf_counter()
+        for key in compact_keys:
+            _decode_cart(get_script(keys=[key], args=[BENCH_TTL], client=client_for(key)))
+        compact_read = time.perf_counter() - start
+
+        self.stdout.write(f"Redis ({len(carts)} carts)")
+        self.report(
+            "json",
+            self.memory_per_cart(json_keys),
+            json_write,
+            json_read,
+            len(carts),
+        )
+        self.report(
+            f"msgpack v{CART_FORMAT_VERSION}",
+            self.memory_per_cart(compact_keys),
+            compact_write,
+            compact_read,
+            len(carts),
+        )
+
+    def memory_per_cart(self, keys):
+        sizes = [client_for(key).memory_usage(key, samples=0) for key in keys]
+        return sum(size or 0 for size in sizes) / len(keys)
+
+    def report(self, label, size, write, read, count, steps=("write", "read")):
+        self.stdout.write(
+            f"  {label:<12} {size:8.0f} bytes/cart"
+            f"  {steps[0]} {write * 1e6 / count:8.1f} us/cart"
+            f"  {steps[1]} {read * 1e6 / count:8.1f} us/cart"
+        )
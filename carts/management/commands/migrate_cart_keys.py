@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+
+from carts.redis_cart import DIRTY_CARTS_KEY, _redis_key, _str
+from carts.redis_client import client_for, scan_clients
+from carts.stock_reservations import HOLDS_KEY
+
+LEGACY_HOLDS_KEY = "stock:holds"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move cart and stock keys written before the hash-tagged layout "
+        "(cart:<key>, stock:*) to their new names (cart:{<key>}, {stock}:*). "
+        "Safe to run more than once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scan-count", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        moved = 0
+        for client in scan_clients():
+            # Keys are decoded: the client may reply with bytes
+            for key in map(_str, client.scan_iter(match="cart:*", count=options["scan_count"])):
+                if key.startswith("cart:{") or key == DIRTY_CARTS_KEY:
+                    continue
+                moved += self.move(client, key, _redis_key(key[len("cart:"):]))
+
+            for key in map(_str, client.scan_iter(match="stock:*", count=options["scan_count"])):
+                if key == LEGACY_HOLDS_KEY:
+                    continue
+                moved += self.move(client, key, "{stock}" + key[len("stock"):])
+
+        self.move_holds()
+        self.move_dirty_members()
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} keys"))
+
+    def move(self, client, old, new):
+        """
+        DUMP/RESTORE rather than RENAME: the new name may be in another slot.
+        """
+        value = client.dump(old)
+        if value is None:
+            return 0
+        ttl = client.pttl(old)
+        client_for(new).restore(new, max(ttl, 0), value, replace=True)
+        client.delete(old)
+        return 1
+
+    def move_holds(self):
+        old = client_for(LEGACY_HOLDS_KEY)
+        holds = old.zrange(LEGACY_HOLDS_KEY, 0, -1, withscores=True)
+        if holds:
+            client_for(HOLDS_KEY).zadd(
+                HOLDS_KEY,
+                {"{stock}" + _str(hold)[len("stock"):]: score for hold, score in holds},
+            )
+        old.delete(LEGACY_HOLDS_KEY)
+
+    def move_dirty_members(self):
+        client = client_for(DIRTY_CARTS_KEY)
+        legacy = [
+            member
+            for member in map(_str, client.smembers(DIRTY_CARTS_KEY))
+            if not member.startswith("cart:{")
+        ]
+        if legacy:
+            client.sadd(DIRTY_CARTS_KEY, *[_redis_key(m[len("cart:"):]) for m in legacy])
+            client.srem(DIRTY_CARTS_KEY, *legacy)
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:37
+
+import shortuuid.main
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Cart = apps.get_model("carts", "Cart")
+    for cart in Cart.objects.annotate(
+        line_total=Coalesce(Sum(F("items__price_snapshot") * F("items__quantity")), 0, output_field=models.DecimalField()),
+        line_count=Coalesce(Sum("items__quantity"), 0),
+    ).iterator():
+        Cart.objects.filter(pk=cart.pk).update(
+            total_amount=cart.line_total, item_count=cart.line_count
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0010_alter_cart_id_alter_cartitem_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
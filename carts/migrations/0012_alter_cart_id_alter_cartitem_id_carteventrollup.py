@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:59
+
+import shortuuid.main
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0011_cart_item_count_cart_total_amount_alter_cart_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.CreateModel(
+            name='CartEventRollup',
+            fields=[
+                ('id', models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True)),
+                ('hour', models.DateTimeField()),
+                ('event', models.CharField(max_length=16)),
+                ('product_id', models.CharField(blank=True, default='', max_length=22)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-hour'],
+                'unique_together': {('hour', 'event', 'product_id')},
+            },
+        ),
+    ]
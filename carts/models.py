@@ -17,6 +17,9 @@ class Cart(models.Model):
     )
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    # Running totals, kept in step with the Redis cart on every write
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -25,7 +28,7 @@ class Cart(models.Model):
 
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.total_amount
 
 
 class CartItem(models.Model):
@@ -62,4 +65,31 @@ class CartItem(models.Model):
         ordering = ["-added_at"]
 
 
+class CartEventRollup(models.Model):
+    """
+    Hourly totals of cart activity, filled from the cart event stream
+    (see carts/cart_events.py). product_id is empty for cart-level events.
+    """
+
+    id = models.CharField(
+        primary_key=True,
+        max_length=22,
+        default=shortuuid.uuid,
+        editable=False,
+        unique=True,
+    )
+    hour = models.DateTimeField()
+    event = models.CharField(max_length=16)
+    product_id = models.CharField(max_length=22, blank=True, default="")
+    count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("hour", "event", "product_id")
+        ordering = ["-hour"]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.event} {self.product_id}".strip()
+
+
 # Create your models here.
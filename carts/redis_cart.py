@@ -1,71 +1,243 @@
-import json
+from decimal import ROUND_HALF_UP, Decimal
 
 import redis
 
-# -------------------- REDIS CONNECTION --------------------
-REDIS_HOST = "redis"
-REDIS_PORT = 6379
-REDIS_DB = 0
+from . import redis_scripts
+from .redis_client import (
+    client_for,
+    get_redis,
+    group_by_client,
+    same_slot,
+    scan_clients,
+    single_server,
+)
 
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+CART_TTL = 86400
+
+# Each cart is a Redis hash under cart:{key} with one field per product,
+# holding msgpack [quantity, price in minor units], plus the format version
+# and running totals. The layout lives in redis_scripts.py; every read and
+# write goes through those scripts, which also upgrade older carts in place.
+# The braces are a Redis Cluster hash tag: everything kept for one cart
+# (items, totals, revision) is in that single key's slot.
+CART_FORMAT_VERSION = redis_scripts.FORMAT_VERSION
+
+# Set of cart keys changed in Redis but not yet written to Postgres
+# (write-behind mode, see carts/cart_sync.py).
+DIRTY_CARTS_KEY = "cart:dirty"
+
+# Where the cart sweeper resumes its SCAN (kept outside the cart:* namespace)
+SWEEP_CURSOR_KEY = "cart-sweep:cursor"
+
+# Reverse index, product id -> set of cart keys holding it (see
+# carts/cart_repricing.py). Entries are added on every write that can add a
+# product; on a single server the scripts also drop them when a line is
+# removed, elsewhere a repricing drops them lazily when it finds the
+# product gone.
+PRODUCT_CARTS_PREFIX = "cart-index:product:"
+
+# SCAN cursors are 64-bit; the sweeper's cursor also carries which server
+# (see redis_client.scan_clients) it is on, in the bits above those.
+_CURSOR_BITS = 64
+
+
+# -------------------- LUA SCRIPTS --------------------
+_scripts = {}
+
+
+def _get_script(name, index_products=False):
+    script = _scripts.get((name, index_products))
+    if script is None:
+        source = getattr(redis_scripts, name)
+        if index_products:
+            source = redis_scripts.with_product_index(source, PRODUCT_CARTS_PREFIX)
+        script = get_redis().register_script(source)
+        _scripts[(name, index_products)] = script
+    return script
+
+
+def _run_script(name, key, *args, dirty=False, index=False, client=None):
+    """
+    Run one of the scripts in redis_scripts against cart:{key}.
+    register_script() runs EVALSHA and falls back to loading the script again
+    if Redis answers NOSCRIPT (e.g. after SCRIPT FLUSH or a restart).
+    dirty=True also records the cart in the write-behind dirty set, in the
+    same call when both keys are in one slot.
+    index=True keeps the product -> carts index in the same call on a single
+    server; elsewhere the caller follows up with _index_cart_products().
+    Raises CartVersionConflict when an expected version did not match.
+    """
+    redis_key = _redis_key(key)
+    keys = [redis_key]
+    mark_after = False
+    if dirty:
+        if same_slot(redis_key, DIRTY_CARTS_KEY):
+            keys.append(DIRTY_CARTS_KEY)
+        else:
+            mark_after = True
+    try:
+        result = _get_script(name, index and single_server())(
+            keys=keys, args=list(args), client=client or client_for(redis_key)
+        )
+    except redis.ResponseError as exc:
+        message = str(exc)
+        if message.startswith(VERSION_CONFLICT):
+            raise CartVersionConflict(message[len(VERSION_CONFLICT):].strip()) from exc
+        raise
+    if mark_after:
+        mark_carts_dirty([key])
+    return result
+
+
+def _str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _redis_key(key):
+    return f"cart:{{{key}}}"
+
+
+def _cart_key(redis_key):
+    """
+    The cart key inside a Redis key: cart:{user:42} -> user:42.
+    Also accepts keys written before carts were hash tagged (cart:user:42).
+    """
+    key = _str(redis_key)[len("cart:"):]
+    if key.startswith("{") and key.endswith("}"):
+        return key[1:-1]
+    return key
+
+
+def product_carts_key(product_id):
+    return f"{PRODUCT_CARTS_PREFIX}{product_id}"
+
+
+def _index_cart_products(key, product_ids, ttl=CART_TTL):
+    """
+    Record `key` in the reverse index of every product in `product_ids`:
+    one pipelined SADD + EXPIRE per product (per server when sharded).
+    The index outlives the carts it lists by at most one TTL.
+    Only needed on Redis Cluster or shards: on a single server the scripts
+    run with index=True have already done it.
+    """
+    if single_server():
+        return
+    for client, group in group_by_client(product_carts_key(pid) for pid in product_ids):
+        pipe = client.pipeline(transaction=False)
+        for index_key in group:
+            pipe.sadd(index_key, key)
+            pipe.expire(index_key, ttl)
+        pipe.execute()
+
+
+class CartData(dict):
+    """
+    Cart items keyed by product id ({"quantity", "price_snapshot", "subtotal"}),
+    plus the running `total`, `item_count` and `version` stored alongside
+    them in Redis.
+    """
+
+    def __init__(self, items=(), total=0.0, item_count=0, version="0"):
+        super().__init__(items)
+        self.total = total
+        self.item_count = item_count
+        self.version = version
+
+
+class CartVersionConflict(Exception):
+    """
+    The cart changed since the version the client based its write on.
+    """
+
+    def __init__(self, current_version):
+        super().__init__(f"Cart is at version {current_version}")
+        self.current_version = current_version
+
+
+VERSION_CONFLICT = "VERSION_CONFLICT"
+
+
+def to_minor_units(price):
+    """
+    Convert a price (Decimal, float or str) to integer minor units (kobo/cents).
+    """
+    return int(Decimal(str(price or 0)).quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+
+
+def _decode_cart(reply):
+    """
+    Turn the flat [count, total, version, pid, quantity, price, ...] list
+    returned by the scripts into CartData. Prices come back in minor units.
+    """
+    if not reply:
+        return CartData()
+    cart = CartData(
+        total=int(reply[1]) / 100, item_count=int(reply[0]), version=_str(reply[2])
+    )
+    for i in range(3, len(reply), 3):
+        qty, price = int(reply[i + 1]), int(reply[i + 2])
+        if qty <= 0:
+            continue
+        cart[_str(reply[i])] = {
+            "quantity": qty,
+            "price_snapshot": price / 100,
+            "subtotal": qty * price / 100,
+        }
+    return cart
 
 
 # -------------------- GET CART --------------------
-def get_cart(key, ttl=86400):
+def get_cart(key, ttl=CART_TTL):
     """
     Retrieve cart from Redis.
     'key' = session key (guest) OR user:{id} (authenticated)
-    Automatically extends TTL (sliding expiration).
-    Returns an empty dict if no cart exists or cache is corrupted.
+    Automatically extends TTL (sliding expiration) in the same call.
+    Returns an empty dict if no cart exists.
     """
-    redis_key = f"cart:{key}"
-    data = r.get(redis_key)
+    return _decode_cart(_run_script("GET_CART", key, ttl))
 
-    if not data:
-        return {}
 
-    try:
-        cart = json.loads(data)
-        if not isinstance(cart, dict):
-            raise ValueError("Cart is not a dict")
-    except (json.JSONDecodeError, ValueError):
-        # Corrupt cache → delete it and return empty cart
-        r.delete(redis_key)
-        return {}
-
-    # Sliding expiration: refresh TTL on access
-    r.expire(redis_key, ttl)
-    return cart
+# -------------------- GET CART VERSION --------------------
+def get_cart_version(key, ttl=CART_TTL):
+    """
+    Current version of the cart ("0" when it is empty), without its items.
+    """
+    return _str(_run_script("GET_VERSION", key, ttl))
+
+
+# -------------------- GET CART TOTALS --------------------
+def get_cart_totals(key, ttl=CART_TTL):
+    """
+    Read only the running totals of a cart, without its items.
+    Returns {"total", "item_count"}.
+    """
+    count, total = _run_script("GET_TOTALS", key, ttl)
+    return {"total": int(total or 0) / 100, "item_count": int(count or 0)}
 
 
 # -------------------- SAVE CART --------------------
-def save_cart(key, cart_data, ttl=86400):
+def save_cart(key, cart_data, ttl=CART_TTL):
     """
     Save the cart back to Redis.
     Overwrites existing cart.
-    Ensures quantities are positive integers and subtotal is recalculated.
+    Ensures quantities are positive integers; items with no quantity are dropped.
+    Returns the saved cart.
     """
-    redis_key = f"cart:{key}"
     try:
+        args = [ttl]
         for pid, item in cart_data.items():
-            # Ensure quantity is valid
-            qty = int(item.get("quantity", 0))
-            if qty < 0:
-                qty = 0
-            item["quantity"] = qty
-
-            # Ensure price_snapshot is valid
-            price = float(item.get("price_snapshot", 0.0))
-            item["price_snapshot"] = price
-
-            # Recalculate subtotal
-            item["subtotal"] = qty * price
-
-        # Save serialized cart in Redis with TTL
-        r.setex(redis_key, ttl, json.dumps(cart_data))
-    except (TypeError, ValueError):
+            qty = max(int(item.get("quantity", 0)), 0)
+            if qty == 0:
+                continue
+            args.extend([str(pid), qty, to_minor_units(item.get("price_snapshot"))])
+    except (TypeError, ValueError, ArithmeticError, AttributeError):
         # Corrupt cart_data → delete key
-        r.delete(redis_key)
+        clear_cart(key)
+        return CartData()
+
+    cart = _decode_cart(_run_script("SAVE_CART", key, *args, index=True))
+    _index_cart_products(key, cart, ttl)
+    return cart
 
 
 # -------------------- CLEAR CART --------------------
@@ -73,59 +245,325 @@ def clear_cart(key):
     """
     Remove the cart completely from Redis.
     """
-    redis_key = f"cart:{key}"
-    r.delete(redis_key)
+    redis_key = _redis_key(key)
+    client_for(redis_key).delete(redis_key)
+
+
+# -------------------- SET CART ITEM --------------------
+def set_cart_item(
+    key, product_id, quantity, price, ttl=CART_TTL, dirty=False, expected_version=None
+):
+    """
+    Insert or overwrite a single item (quantity and price snapshot).
+    A quantity of 0 removes the item.
+    Returns the updated cart.
+    With expected_version, raises CartVersionConflict unless the cart is
+    still at that version.
+    """
+    flat = _run_script(
+        "SET_ITEM",
+        key,
+        str(product_id),
+        max(int(quantity), 0),
+        to_minor_units(price),
+        ttl,
+        expected_version or "",
+        dirty=dirty,
+        index=True,
+    )
+    if quantity > 0:
+        _index_cart_products(key, [product_id], ttl)
+    return _decode_cart(flat)
 
 
 # -------------------- UPDATE CART ITEM --------------------
-def update_cart_item(key, product_id, quantity=None, price=None):
+def update_cart_item(
+    key,
+    product_id,
+    quantity=None,
+    price=None,
+    ttl=CART_TTL,
+    dirty=False,
+    expected_version=None,
+):
     """
     Update an existing item in Redis cart.
     If quantity is None, do not change it.
     If price is None, do not change it.
-    Recalculates subtotal automatically.
-    Returns True if item exists and updated, False otherwise.
+    A quantity of 0 removes the item.
+    Returns the updated cart, or None if the item is not in the cart.
+    With expected_version, raises CartVersionConflict unless the cart is
+    still at that version.
     """
-    cart = get_cart(key)
-    pid = str(product_id)
+    flat = _run_script(
+        "UPDATE_ITEM",
+        key,
+        str(product_id),
+        "" if quantity is None else max(int(quantity), 0),
+        "" if price is None else to_minor_units(price),
+        ttl,
+        expected_version or "",
+        dirty=dirty,
+        index=True,
+    )
+    if flat is None:
+        return None  # item does not exist
+    if quantity:
+        _index_cart_products(key, [product_id], ttl)
+    return _decode_cart(flat)
 
-    if pid not in cart:
-        return False  # item does not exist
 
-    # Update quantity if provided
-    if quantity is not None:
-        cart[pid]["quantity"] = max(int(quantity), 0)
+# -------------------- ADD/INCREMENT CART ITEM --------------------
+def add_or_increment_cart_item(
+    key,
+    product_id,
+    quantity=1,
+    price=0.0,
+    ttl=CART_TTL,
+    refresh_price=False,
+    dirty=False,
+    expected_version=None,
+):
+    """
+    Adds a new item to cart or increments the quantity if it exists.
+    The increment is atomic, so concurrent adds never overwrite each other.
+    The price snapshot is only set for new items unless refresh_price is True.
+    Returns the updated cart.
+    With expected_version, raises CartVersionConflict unless the cart is
+    still at that version.
+    """
+    flat = _run_script(
+        "ADD_ITEM",
+        key,
+        str(product_id),
+        int(quantity),
+        to_minor_units(price),
+        ttl,
+        "1" if refresh_price else "0",
+        expected_version or "",
+        dirty=dirty,
+        index=True,
+    )
+    _index_cart_products(key, [product_id], ttl)
+    return _decode_cart(flat)
+
+
+# -------------------- REMOVE CART ITEM --------------------
+def remove_cart_item(key, product_id, ttl=CART_TTL, dirty=False, expected_version=None):
+    """
+    Remove a single product from the cart.
+    Redis drops the key on its own once the last item is removed.
+    Returns the updated cart.
+    With expected_version, raises CartVersionConflict unless the cart is
+    still at that version.
+    """
+    flat = _run_script(
+        "REMOVE_ITEM", key, str(product_id), ttl, expected_version or "", dirty=dirty, index=True
+    )
+    return _decode_cart(flat)
 
-    # Update price if provided
-    if price is not None:
-        cart[pid]["price_snapshot"] = float(price)
 
-    # Recalculate subtotal
-    cart[pid]["subtotal"] = cart[pid]["quantity"] * cart[pid]["price_snapshot"]
+# -------------------- BATCH OPERATIONS --------------------
+def apply_cart_operations(
+    key, operations, ttl=CART_TTL, refresh_price=False, dirty=False, expected_version=None
+):
+    """
+    Apply several item changes in one atomic script call.
+    `operations` is a list of (op, product_id, quantity, price) tuples where
+    op is "add" (increment), "set" (quantity 0 removes) or "remove".
+    Returns the updated cart.
+    With expected_version, raises CartVersionConflict unless the cart is
+    still at that version.
+    """
+    args = [ttl, "1" if refresh_price else "0", expected_version or ""]
+    for op, product_id, quantity, price in operations:
+        args.extend([op, str(product_id), int(quantity or 0), to_minor_units(price)])
+    flat = _run_script("BATCH_ITEMS", key, *args, dirty=dirty, index=True)
+    _index_cart_products(
+        key, {str(pid) for op, pid, quantity, _ in operations if op != "remove" and quantity}, ttl
+    )
+    return _decode_cart(flat)
 
-    save_cart(key, cart)
-    return True
 
+# -------------------- MERGE CARTS --------------------
+def merge_carts(target_key, source_key, ttl=CART_TTL):
+    """
+    Fold the source cart (e.g. a guest session) into the target cart in one
+    atomic script call, then delete the source.
+    Quantities of products in both carts are added up.
+    The target is recorded in the dirty set so it is persisted.
+    Returns the merged cart.
 
-# -------------------- ADD/INCREMENT CART ITEM --------------------
-def add_or_increment_cart_item(key, product_id, quantity=1, price=0.0):
+    On Redis Cluster or shards the two carts usually live in different slots:
+    the source is then taken (read and deleted) first and its lines are
+    passed to the merge. If the merge fails the source cart is put back.
     """
-    Adds a new item to cart or increments the quantity if it exists.
-    Automatically calculates subtotal.
+    target, source = _redis_key(target_key), _redis_key(source_key)
+    if same_slot(target, DIRTY_CARTS_KEY, source):
+        flat = _get_script("MERGE_CART", single_server())(
+            keys=[target, DIRTY_CARTS_KEY, source], args=[ttl], client=client_for(target)
+        )
+    else:
+        flat = _take_and_merge(target_key, source_key, ttl)
+    cart = _decode_cart(flat)
+    _index_cart_products(target_key, cart, ttl)
+    return cart
+
+
+def _take_and_merge(target_key, source_key, ttl):
+    """
+    Merge across hash slots: take the source cart, then merge its lines.
+    """
+    taken = _run_script("TAKE_CART", source_key, ttl)
+    lines = [value for i in range(3, len(taken), 3) for value in taken[i:i + 3]]
+    try:
+        flat = _run_script("MERGE_CART", target_key, ttl, *lines, dirty=True, index=True)
+    except redis.RedisError:
+        if lines:
+            _run_script("SAVE_CART", source_key, ttl, *lines)
+        raise
+    return flat
+
+
+# -------------------- BULK READ --------------------
+def get_carts(keys, ttl=CART_TTL):
+    """
+    Read several carts in one pipelined round trip (one per shard).
+    Returns {key: cart}.
+    """
+    carts = {}
+    redis_keys = {_redis_key(key): key for key in keys}
+    for client, group in group_by_client(redis_keys):
+        pipe = client.pipeline(transaction=False)
+        group = [redis_keys[redis_key] for redis_key in group]
+        for key in group:
+            _run_script("GET_CART", key, ttl, client=pipe)
+        carts.update((key, _decode_cart(flat)) for key, flat in zip(group, pipe.execute()))
+    return carts
+
+
+# -------------------- REPRICING --------------------
+def reprice_carts(keys, product_id, price):
+    """
+    Set the price snapshot of `product_id` to `price` in each cart, one
+    pipelined round trip per server. Cart TTLs are left alone.
+    Returns {key: 1 repriced, 0 price unchanged, -1 product not in cart}.
+    """
+    results = {}
+    redis_keys = {_redis_key(key): key for key in keys}
+    for client, group in group_by_client(redis_keys):
+        pipe = client.pipeline(transaction=False)
+        group = [redis_keys[redis_key] for redis_key in group]
+        for key in group:
+            _run_script("REPRICE_ITEM", key, str(product_id), to_minor_units(price), client=pipe)
+        results.update(zip(group, (int(result) for result in pipe.execute())))
+    return results
+
+
+def scan_product_carts(product_id, cursor=0, count=500):
     """
-    cart = get_cart(key)
-    pid = str(product_id)
+    One SSCAN page of the carts indexed for `product_id`.
+    Returns (next_cursor, keys); next_cursor is 0 at the end.
+    """
+    index_key = product_carts_key(product_id)
+    cursor, members = client_for(index_key).sscan(index_key, cursor, count=count)
+    return int(cursor), [_str(member) for member in members]
+
 
-    if pid in cart:
-        cart[pid]["quantity"] += int(quantity)
+def unindex_carts(product_id, keys):
+    keys = list(keys)
+    if keys:
+        index_key = product_carts_key(product_id)
+        client_for(index_key).srem(index_key, *keys)
+
+
+# -------------------- DIRTY CARTS (WRITE-BEHIND) --------------------
+def pop_dirty_carts(count):
+    """
+    Take up to `count` carts off the dirty set.
+    Returns cart keys as used by the other helpers (e.g. "user:{id}").
+    """
+    members = client_for(DIRTY_CARTS_KEY).spop(DIRTY_CARTS_KEY, count) or []
+    return [_cart_key(member) for member in members]
+
+
+def mark_carts_dirty(keys):
+    """
+    Put carts (back) on the dirty set, e.g. after a failed flush.
+    """
+    keys = list(keys)
+    if keys:
+        client_for(DIRTY_CARTS_KEY).sadd(DIRTY_CARTS_KEY, *[_redis_key(key) for key in keys])
+
+
+def is_cart_dirty(key):
+    return bool(client_for(DIRTY_CARTS_KEY).sismember(DIRTY_CARTS_KEY, _redis_key(key)))
+
+
+def unmark_cart_dirty(key):
+    """
+    Take a single cart off the dirty set before flushing it inline.
+    """
+    client_for(DIRTY_CARTS_KEY).srem(DIRTY_CARTS_KEY, _redis_key(key))
+
+
+# -------------------- SWEEPING --------------------
+def scan_carts(cursor=0, count=1000):
+    """
+    One SCAN page over the cart keys.
+    Returns (next_cursor, keys) with keys as used by the other helpers;
+    next_cursor is 0 once the whole keyspace (every server) has been walked.
+    """
+    clients = scan_clients()
+    index, node_cursor = cursor >> _CURSOR_BITS, cursor & ((1 << _CURSOR_BITS) - 1)
+    if index >= len(clients):  # servers were removed since the cursor was saved
+        return 0, []
+
+    node_cursor, members = clients[index].scan(node_cursor, match=_redis_key("*"), count=count)
+    node_cursor = int(node_cursor)
+    if node_cursor == 0:
+        index += 1
+        cursor = index << _CURSOR_BITS if index < len(clients) else 0
     else:
-        cart[pid] = {
-            "quantity": int(quantity),
-            "price_snapshot": float(price),
-            "subtotal": int(quantity) * float(price),
-        }
+        cursor = (index << _CURSOR_BITS) | node_cursor
+    return cursor, [_cart_key(member) for member in members]
+
+
+def get_cart_ttls(keys):
+    """
+    Remaining TTL in seconds of each cart (-1 = no expiry, -2 = gone).
+    Returns {key: ttl}.
+    """
+    ttls = {}
+    redis_keys = {_redis_key(key): key for key in keys}
+    for client, group in group_by_client(redis_keys):
+        pipe = client.pipeline(transaction=False)
+        for redis_key in group:
+            pipe.ttl(redis_key)
+        ttls.update((redis_keys[redis_key], ttl) for redis_key, ttl in zip(group, pipe.execute()))
+    return ttls
+
+
+def expire_carts(keys, ttl=CART_TTL):
+    for client, group in group_by_client(_redis_key(key) for key in keys):
+        pipe = client.pipeline(transaction=False)
+        for redis_key in group:
+            pipe.expire(redis_key, ttl)
+        pipe.execute()
+
+
+def delete_carts(keys):
+    # One DEL per key: a multi-key DEL cannot span cluster slots
+    for client, group in group_by_client(_redis_key(key) for key in keys):
+        pipe = client.pipeline(transaction=False)
+        for redis_key in group:
+            pipe.delete(redis_key)
+        pipe.execute()
+
+
+def get_sweep_cursor():
+    return int(client_for(SWEEP_CURSOR_KEY).get(SWEEP_CURSOR_KEY) or 0)
+
 
-    # Always recalc subtotal to ensure correctness
-    cart[pid]["subtotal"] = cart[pid]["quantity"] * cart[pid]["price_snapshot"]
-    save_cart(key, cart)
-    return cart[pid]
+def set_sweep_cursor(cursor):
+    client_for(SWEEP_CURSOR_KEY).set(SWEEP_CURSOR_KEY, cursor)
@@ -0,0 +1,183 @@
+"""
+Redis client used by the cart store and stock reservations.
+
+CART_REDIS["MODE"] picks the deployment:
+- "single"  (default) one Redis server at CART_REDIS["URL"]
+- "cluster" a Redis Cluster, reached through any node at CART_REDIS["URL"]
+- "sharded" independent servers listed in CART_REDIS["SHARDS"]; every key
+  goes to the server owning its hash slot (the same CRC16 slot Redis Cluster
+  uses, split into equal ranges), so keys sharing a {hash tag} always land
+  on the same server.
+
+Keys that are used together by one script carry the same hash tag (e.g.
+cart:{user:42}, {stock}:holds), so a script only ever touches one slot.
+Adding or removing shards moves slots: carts are rebuilt from Postgres (or
+expire) and stock counters are re-seeded, but open reservations are lost.
+"""
+
+import threading
+
+import redis
+from django.conf import settings
+from redis.crc import REDIS_CLUSTER_HASH_SLOTS, key_slot
+
+SINGLE = "single"
+CLUSTER = "cluster"
+SHARDED = "sharded"
+
+
+class ShardedRedis:
+    """
+    Client-side sharding over independent Redis servers.
+    Route each key with node_for(); there is no cross-server command.
+    """
+
+    def __init__(self, nodes):
+        if not nodes:
+            raise ValueError("CART_REDIS['SHARDS'] is empty")
+        self.nodes = list(nodes)
+
+    def node_for(self, key):
+        slot = slot_for(key)
+        return self.nodes[slot * len(self.nodes) // REDIS_CLUSTER_HASH_SLOTS]
+
+    def register_script(self, script):
+        # The Script object only holds the source and its SHA; callers pass
+        # the node to run it on.
+        return self.nodes[0].register_script(script)
+
+
+# -------------------- CONNECTION --------------------
+_client = None
+_client_lock = threading.Lock()
+
+
+def _pool_options(options):
+    return {
+        "max_connections": options.get("MAX_CONNECTIONS"),
+        "socket_timeout": options.get("SOCKET_TIMEOUT"),
+        "socket_connect_timeout": options.get("SOCKET_CONNECT_TIMEOUT"),
+        "health_check_interval": options.get("HEALTH_CHECK_INTERVAL", 0),
+        "decode_responses": True,
+    }
+
+
+def _build_client():
+    options = settings.CART_REDIS
+    mode = options.get("MODE", SINGLE)
+
+    if mode == CLUSTER:
+        return redis.RedisCluster.from_url(options["URL"], **_pool_options(options))
+
+    if mode == SHARDED:
+        return ShardedRedis(
+            redis.Redis.from_url(url, **_pool_options(options)) for url in options["SHARDS"]
+        )
+
+    if options.get("USE_CACHE_POOL"):
+        # Same server, timeouts and pool size as the django-redis cache, but
+        # not the same connections: the cache reads raw bytes, while every
+        # caller here expects str replies (decode_responses=True).
+        from django_redis import get_redis_connection
+
+        cache_pool = get_redis_connection(options.get("CACHE_ALIAS", "default")).connection_pool
+        pool = redis.ConnectionPool(
+            connection_class=cache_pool.connection_class,
+            max_connections=cache_pool.max_connections,
+            **{**cache_pool.connection_kwargs, "decode_responses": True},
+        )
+        return redis.Redis(connection_pool=pool)
+
+    pool = redis.ConnectionPool.from_url(options["URL"], **_pool_options(options))
+    return redis.Redis(connection_pool=pool)
+
+
+def get_redis():
+    """
+    Return the process-wide cart Redis client, creating it on first use.
+    The pool is created lazily so nothing connects at import time and each
+    forked worker gets its own connections.
+    In sharded mode this is a ShardedRedis; use client_for() to reach a key.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+# -------------------- ROUTING --------------------
+def slot_for(key):
+    """
+    Redis Cluster hash slot of `key` (only the {hash tag} counts if present).
+    """
+    return key_slot(key.encode() if isinstance(key, str) else key)
+
+
+def client_for(key):
+    """
+    The client to send commands for `key` to. A single server or a cluster
+    client routes on its own; with shards this is the owning server.
+    """
+    client = get_redis()
+    if isinstance(client, ShardedRedis):
+        return client.node_for(key)
+    return client
+
+
+def group_by_client(keys):
+    """
+    Split `keys` per server so each group can be pipelined, scripts
+    included (a cluster pipeline refuses EVALSHA, so on a cluster each
+    group goes to its primary's own connection).
+    Returns [(client, keys)]; a single group on a single server.
+    """
+    keys = list(keys)
+    client = get_redis()
+    if isinstance(client, ShardedRedis):
+        node_for = client.node_for
+    elif isinstance(client, redis.RedisCluster):
+
+        def node_for(key):
+            return client.get_redis_connection(client.get_node_from_key(key))
+
+    else:
+        return [(client, keys)] if keys else []
+
+    groups = {}
+    for key in keys:
+        node = node_for(key)
+        groups.setdefault(id(node), (node, []))[1].append(key)
+    return list(groups.values())
+
+
+def scan_clients():
+    """
+    One client per server holding keys, in a stable order, for SCAN:
+    the server itself, every cluster primary, or every shard.
+    """
+    client = get_redis()
+    if isinstance(client, ShardedRedis):
+        return client.nodes
+    if isinstance(client, redis.RedisCluster):
+        primaries = sorted(client.get_primaries(), key=lambda node: node.name)
+        return [client.get_redis_connection(node) for node in primaries]
+    return [client]
+
+
+def single_server():
+    """
+    Whether every key lives on one plain Redis server (no cluster, no shards).
+    """
+    return not isinstance(get_redis(), (redis.RedisCluster, ShardedRedis))
+
+
+def same_slot(*keys):
+    """
+    Whether one script may touch all of `keys` together. Always true on a
+    single server; otherwise they have to share a hash slot.
+    """
+    if single_server():
+        return True
+    return len({slot_for(key) for key in keys}) <= 1
@@ -0,0 +1,561 @@
+"""
+Lua sources for the Redis cart.
+
+Every script works on one cart hash (KEYS[1]) and does its validation,
+mutation and sliding TTL refresh server-side, so each cart operation is a
+single EVALSHA round trip.
+
+Cart format (version 2): one hash field per line,
+    {product_id} -> msgpack [quantity, price in minor units (kobo/cents)]
+plus metadata fields, all starting with '_':
+    _v     -> format version
+    _count -> number of units in the cart
+    _total -> sum of quantity * price, in minor units
+    _rev   -> revision, bumped by every change (used as the cart ETag)
+Every mutation keeps _count/_total up to date, so reading them is O(1).
+A new cart starts its revision at the server time in microseconds, so a
+cart that is emptied (deleted) and filled again never reuses a revision.
+
+Older carts are upgraded in place the first time a script touches them:
+    version 0: one JSON string {pid: {quantity, price_snapshot, subtotal}}
+    version 1: hash with q:{pid} -> quantity and p:{pid} -> float price
+
+Scripts that read or change the cart return it as a flat list of plain
+integers and strings (see dump()), so the client never has to decode
+msgpack itself:
+    [count, total, revision, pid, quantity, price, pid, quantity, price, ...]
+
+Scripts that change items accept an expected revision ('' = any) and fail
+with a VERSION_CONFLICT <current revision> error when the cart has moved on.
+
+Mutating scripts take an optional KEYS[2]: the set of dirty carts waiting
+to be written back to Postgres (write-behind mode). When given, the cart
+key is added to it in the same call. On Redis Cluster or shards the set is
+in another slot, so the client adds the cart to it after the script.
+The product -> carts index used for repricing works the same way: on a
+single server the mutating scripts maintain it (see with_product_index),
+otherwise the client adds to it after the script.
+
+The stock reservation scripts used at checkout are at the end of the file.
+"""
+
+FORMAT_VERSION = 2
+
+# Shared helpers prepended to every script.
+PRELUDE = (
+    """
+local key = KEYS[1]
+local FORMAT = '"""
+    + str(FORMAT_VERSION)
+    + """'
+
+local function int_str(n)
+    return string.format('%d', n)
+end
+
+local function to_minor(price)
+    return math.floor((tonumber(price) or 0) * 100 + 0.5)
+end
+
+local function is_meta(field)
+    return string.sub(field, 1, 1) == '_'
+end
+
+-- Quantity and unit price (minor units) of one line; 0, 0 when missing
+local function get_line(k, pid)
+    local raw = redis.call('HGET', k, pid)
+    if not raw then
+        return 0, 0
+    end
+    local item = cmsgpack.unpack(raw)
+    return item[1], item[2]
+end
+
+-- Write one line (quantity 0 removes it) and move the totals by the difference
+local function set_line(k, pid, qty, price)
+    local before_qty, before_price = get_line(k, pid)
+    if qty <= 0 then
+        qty, price = 0, 0
+        redis.call('HDEL', k, pid)
+    else
+        redis.call('HSET', k, pid, cmsgpack.pack({qty, price}))
+    end
+    if qty ~= before_qty then
+        redis.call('HINCRBY', k, '_count', int_str(qty - before_qty))
+    end
+    local diff = qty * price - before_qty * before_price
+    if diff ~= 0 then
+        redis.call('HINCRBY', k, '_total', int_str(diff))
+    end
+end
+
+-- Rewrite a version 0/1 cart in the current format, keeping its TTL
+local function upgrade(k)
+    k = k or key
+    local kind = redis.call('TYPE', k).ok
+    if kind == 'none' then
+        return
+    end
+    if kind == 'hash' and redis.call('HGET', k, '_v') == FORMAT then
+        return
+    end
+
+    local lines = {}
+    if kind == 'string' then
+        local ok, cart = pcall(cjson.decode, redis.call('GET', k))
+        if ok and type(cart) == 'table' then
+            for pid, item in pairs(cart) do
+                if type(item) == 'table' then
+                    lines[pid] = {tonumber(item.quantity), item.price_snapshot}
+                end
+            end
+        end
+    elseif kind == 'hash' then
+        local fields = redis.call('HGETALL', k)
+        for i = 1, #fields, 2 do
+            local prefix, pid = string.sub(fields[i], 1, 2), string.sub(fields[i], 3)
+            if prefix == 'q:' or prefix == 'p:' then
+                lines[pid] = lines[pid] or {}
+                lines[pid][prefix == 'q:' and 1 or 2] = fields[i + 1]
+            end
+        end
+    end
+
+    local pttl = redis.call('PTTL', k)
+    redis.call('DEL', k)
+    for pid, item in pairs(lines) do
+        local qty = math.floor(tonumber(item[1]) or 0)
+        if qty > 0 then
+            set_line(k, pid, qty, to_minor(item[2]))
+        end
+    end
+    if redis.call('EXISTS', k) == 1 then
+        redis.call('HSET', k, '_v', FORMAT)
+        if pttl > 0 then
+            redis.call('PEXPIRE', k, pttl)
+        end
+    end
+end
+
+local function get_rev(k)
+    return redis.call('HGET', k or key, '_rev') or '0'
+end
+
+local function conflicts(expected)
+    return expected ~= nil and expected ~= '' and expected ~= get_rev()
+end
+
+local function conflict_reply()
+    return redis.error_reply('VERSION_CONFLICT ' .. get_rev())
+end
+
+-- After a change: drop the cart once its last line is gone, otherwise
+-- stamp the format and bump the revision
+local function finish(k)
+    k = k or key
+    local count = tonumber(redis.call('HGET', k, '_count'))
+    if not count or count <= 0 then
+        redis.call('DEL', k)
+        return
+    end
+    redis.call('HSET', k, '_v', FORMAT)
+    if redis.call('HEXISTS', k, '_rev') == 1 then
+        redis.call('HINCRBY', k, '_rev', 1)
+    else
+        local now = redis.call('TIME')
+        redis.call('HSET', k, '_rev', int_str(now[1] * 1000000 + now[2]))
+    end
+end
+
+local function dump(k)
+    k = k or key
+    local meta = redis.call('HMGET', k, '_count', '_total', '_rev')
+    local out = {tonumber(meta[1]) or 0, tonumber(meta[2]) or 0, meta[3] or '0'}
+    local fields = redis.call('HGETALL', k)
+    for i = 1, #fields, 2 do
+        if not is_meta(fields[i]) then
+            local item = cmsgpack.unpack(fields[i + 1])
+            out[#out + 1] = fields[i]
+            out[#out + 1] = item[1]
+            out[#out + 1] = item[2]
+        end
+    end
+    return out
+end
+
+local function mark_dirty()
+    if KEYS[2] then
+        redis.call('SADD', KEYS[2], key)
+    end
+end
+
+-- Integer >= 0 (quantities that remove a line, prices), else nil
+local function non_negative_int(value)
+    local n = tonumber(value)
+    if not n or n ~= math.floor(n) or n < 0 then
+        return nil
+    end
+    return n
+end
+
+-- Integer > 0, else nil
+local function positive_int(value)
+    local n = non_negative_int(value)
+    if n == 0 then
+        return nil
+    end
+    return n
+end
+
+-- Product -> carts index (see with_product_index); a no-op unless enabled
+local INDEX_PREFIX = false
+
+local function index_line(pid, qty, ttl)
+    if not INDEX_PREFIX then
+        return
+    end
+    local index_key = INDEX_PREFIX .. pid
+    if qty > 0 then
+        redis.call('SADD', index_key, string.match(key, '^cart:{(.*)}$'))
+        redis.call('EXPIRE', index_key, ttl)
+    else
+        redis.call('SREM', index_key, string.match(key, '^cart:{(.*)}$'))
+    end
+end
+"""
+)
+
+
+def with_product_index(source, prefix):
+    """
+    The same script, also keeping the product -> carts index (sets under
+    `prefix`) for every line it writes or removes. The index keys are built
+    inside the script, so this is only for a single server; on Redis Cluster
+    or shards they are in other slots and the client maintains the index.
+    """
+    return source.replace("local INDEX_PREFIX = false", f"local INDEX_PREFIX = '{prefix}'", 1)
+
+
+# ARGV: ttl
+GET_CART = PRELUDE + """
+upgrade()
+redis.call('EXPIRE', key, ARGV[1])
+return dump()
+"""
+
+# ARGV: ttl
+# Only the running totals: {_count, _total}
+GET_TOTALS = PRELUDE + """
+upgrade()
+redis.call('EXPIRE', key, ARGV[1])
+return redis.call('HMGET', key, '_count', '_total')
+"""
+
+# ARGV: ttl
+# Only the revision, e.g. to answer If-None-Match without reading the items
+GET_VERSION = PRELUDE + """
+upgrade()
+redis.call('EXPIRE', key, ARGV[1])
+return get_rev()
+"""
+
+# ARGV: ttl, then one group of product_id, quantity, price per line
+# Replaces the whole cart.
+SAVE_CART = PRELUDE + """
+redis.call('DEL', key)
+for i = 2, #ARGV, 3 do
+    local qty, price = positive_int(ARGV[i + 1]), non_negative_int(ARGV[i + 2])
+    if qty and price then
+        set_line(key, ARGV[i], qty, price)
+        index_line(ARGV[i], qty, ARGV[1])
+    end
+end
+finish()
+redis.call('EXPIRE', key, ARGV[1])
+return dump()
+"""
+
+# ARGV: product_id, quantity, price, ttl, refresh_price ('1' = overwrite),
+#       expected revision
+# The price snapshot is only set for new items unless refresh_price is '1'.
+ADD_ITEM = PRELUDE + """
+upgrade()
+if conflicts(ARGV[6]) then
+    return conflict_reply()
+end
+local qty, price = positive_int(ARGV[2]), non_negative_int(ARGV[3])
+if not qty or not price then
+    return redis.error_reply('quantity must be a positive integer')
+end
+local current_qty, current_price = get_line(key, ARGV[1])
+if current_qty > 0 and ARGV[5] ~= '1' then
+    price = current_price
+end
+set_line(key, ARGV[1], current_qty + qty, price)
+index_line(ARGV[1], qty, ARGV[4])
+finish()
+mark_dirty()
+redis.call('EXPIRE', key, ARGV[4])
+return dump()
+"""
+
+# ARGV: product_id, quantity, price, ttl, expected revision
+# Upsert; a quantity of 0 removes the item.
+SET_ITEM = PRELUDE + """
+upgrade()
+if conflicts(ARGV[5]) then
+    return conflict_reply()
+end
+local qty, price = non_negative_int(ARGV[2]), non_negative_int(ARGV[3])
+if not qty or not price then
+    return redis.error_reply('quantity must be a non-negative integer')
+end
+set_line(key, ARGV[1], qty, price)
+index_line(ARGV[1], qty, ARGV[4])
+finish()
+mark_dirty()
+redis.call('EXPIRE', key, ARGV[4])
+return dump()
+"""
+
+# ARGV: product_id, quantity ('' = unchanged), price ('' = unchanged), ttl,
+#       expected revision
+# Returns nil when the item is not in the cart; a quantity of 0 removes it.
+UPDATE_ITEM = PRELUDE + """
+upgrade()
+if conflicts(ARGV[5]) then
+    return conflict_reply()
+end
+local current_qty, current_price = get_line(key, ARGV[1])
+if current_qty == 0 then
+    return false
+end
+
+local qty, price = current_qty, current_price
+if ARGV[2] ~= '' then
+    qty = non_negative_int(ARGV[2])
+    if not qty then
+        return redis.error_reply('quantity must be a non-negative integer')
+    end
+end
+if ARGV[3] ~= '' then
+    price = non_negative_int(ARGV[3]) or current_price
+end
+set_line(key, ARGV[1], qty, price)
+index_line(ARGV[1], qty, ARGV[4])
+finish()
+mark_dirty()
+redis.call('EXPIRE', key, ARGV[4])
+return dump()
+"""
+
+# ARGV: product_id, ttl, expected revision
+REMOVE_ITEM = PRELUDE + """
+upgrade()
+if conflicts(ARGV[3]) then
+    return conflict_reply()
+end
+if redis.call('HEXISTS', key, ARGV[1]) == 1 then
+    set_line(key, ARGV[1], 0, 0)
+    index_line(ARGV[1], 0, ARGV[2])
+    finish()
+    mark_dirty()
+end
+redis.call('EXPIRE', key, ARGV[2])
+return dump()
+"""
+
+# ARGV: ttl, refresh_price ('1' = overwrite on add), expected revision,
+#       then one group of op, product_id, quantity, price per operation
+# op is 'add' (increment), 'set' (quantity 0 removes) or 'remove'.
+# Everything is validated before the first write, so the batch is all or
+# nothing.
+BATCH_ITEMS = PRELUDE + """
+upgrade()
+if conflicts(ARGV[3]) then
+    return conflict_reply()
+end
+local ops = {}
+for i = 4, #ARGV, 4 do
+    local op = ARGV[i]
+    if op ~= 'add' and op ~= 'set' and op ~= 'remove' then
+        return redis.error_reply('unknown operation ' .. op)
+    end
+    local qty = (op == 'add' and positive_int or non_negative_int)(ARGV[i + 2])
+    local price = non_negative_int(ARGV[i + 3])
+    if op ~= 'remove' and (not qty or not price) then
+        return redis.error_reply('invalid quantity for ' .. ARGV[i + 1])
+    end
+    ops[#ops + 1] = {op, ARGV[i + 1], qty, price}
+end
+
+for _, item in ipairs(ops) do
+    local op, pid, qty, price = item[1], item[2], item[3], item[4]
+    if op == 'add' then
+        local current_qty, current_price = get_line(key, pid)
+        if current_qty > 0 and ARGV[2] ~= '1' then
+            price = current_price
+        end
+        set_line(key, pid, current_qty + qty, price)
+    elseif op == 'set' then
+        set_line(key, pid, qty, price)
+    else
+        qty = 0
+        set_line(key, pid, 0, 0)
+    end
+    index_line(pid, qty, ARGV[1])
+end
+
+if #ops > 0 then
+    finish()
+    mark_dirty()
+end
+redis.call('EXPIRE', key, ARGV[1])
+return dump()
+"""
+
+# KEYS: user cart, dirty set, guest cart
+# ARGV: ttl
+# Folds the guest cart into the user cart and deletes the guest cart.
+# Quantities are added up; lines the user already had keep their price.
+# When the two carts are in different hash slots (Redis Cluster, shards)
+# the guest cart is taken with TAKE_CART first and passed in ARGV instead:
+# KEYS: user cart; ARGV: ttl, then one group of product_id, quantity, price.
+MERGE_CART = PRELUDE + """
+local guest = KEYS[3]
+upgrade()
+
+local lines, first
+if guest then
+    upgrade(guest)
+    lines, first = dump(guest), 4
+    redis.call('DEL', guest)
+else
+    lines, first = ARGV, 2
+end
+
+local merged = 0
+for i = first, #lines, 3 do
+    local pid, qty, price = lines[i], positive_int(lines[i + 1]), non_negative_int(lines[i + 2])
+    if qty and price then
+        local current_qty, current_price = get_line(key, pid)
+        if current_qty > 0 then
+            price = current_price
+        end
+        set_line(key, pid, current_qty + qty, price)
+        index_line(pid, qty, ARGV[1])
+        merged = merged + 1
+    end
+end
+
+if merged > 0 then
+    finish()
+    mark_dirty()
+end
+redis.call('EXPIRE', key, ARGV[1])
+return dump()
+"""
+
+# ARGV: product_id, new price (minor units)
+# Reprices one line in place; the TTL is left alone so idle carts still expire.
+# Returns 1 when repriced, 0 when the line already had that price and -1
+# when the cart (no longer) holds the product.
+REPRICE_ITEM = PRELUDE + """
+upgrade()
+local qty, price = get_line(key, ARGV[1])
+if qty <= 0 then
+    return -1
+end
+local new_price = non_negative_int(ARGV[2])
+if not new_price or new_price == price then
+    return 0
+end
+set_line(key, ARGV[1], qty, new_price)
+finish()
+return 1
+"""
+
+# Returns the cart like GET_CART and deletes it (first half of a merge
+# across hash slots, see MERGE_CART).
+TAKE_CART = PRELUDE + """
+upgrade()
+local out = dump()
+redis.call('DEL', key)
+return out
+"""
+
+
+# -------------------- STOCK RESERVATIONS --------------------
+# Per product:  {stock}:avail:<pid> -> units that can still be reserved
+#               {stock}:held:<pid>  -> units held by open reservations
+# Per hold:     {stock}:hold:<hold_id> -> hash pid -> quantity
+# {stock}:holds is a sorted set of hold keys scored by expiry (unix seconds).
+# Every stock key shares the {stock} hash tag: a reservation covers several
+# products atomically, so they all live in the slot of KEYS[1].
+# Postgres stock == avail + held once everything is settled; see
+# carts/stock_reservations.py. Only RESERVE_STOCK and SETTLE_STOCK change
+# held, and a hold hash only goes away through SETTLE_STOCK (it has no TTL),
+# so held always matches the open holds.
+
+# KEYS: holds zset, hold hash
+# ARGV: expires_at, then one group of product_id, quantity
+# Returns {'ok'}, {'missing', pid} when a counter is not seeded yet, or
+# {'insufficient', pid}. Nothing is reserved unless every line fits.
+RESERVE_STOCK = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return {'ok'}
+end
+for i = 2, #ARGV, 2 do
+    local avail = redis.call('GET', '{stock}:avail:' .. ARGV[i])
+    if not avail then
+        return {'missing', ARGV[i]}
+    end
+    if tonumber(avail) < tonumber(ARGV[i + 1]) then
+        return {'insufficient', ARGV[i]}
+    end
+end
+for i = 2, #ARGV, 2 do
+    redis.call('DECRBY', '{stock}:avail:' .. ARGV[i], ARGV[i + 1])
+    redis.call('INCRBY', '{stock}:held:' .. ARGV[i], ARGV[i + 1])
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+redis.call('ZADD', KEYS[1], ARGV[1], KEYS[2])
+return {'ok'}
+"""
+
+# KEYS: holds zset, hold hash
+# ARGV: '1' to give the units back (release), '0' when they were sold (commit)
+# Returns the number of lines settled (0 if the hold is already gone).
+SETTLE_STOCK = """
+local lines = redis.call('HGETALL', KEYS[2])
+for i = 1, #lines, 2 do
+    local held_key = '{stock}:held:' .. lines[i]
+    if redis.call('DECRBY', held_key, lines[i + 1]) <= 0 then
+        redis.call('DEL', held_key)
+    end
+    if ARGV[1] == '1' then
+        redis.call('INCRBY', '{stock}:avail:' .. lines[i], lines[i + 1])
+    end
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], KEYS[2])
+return #lines / 2
+"""
+
+# KEYS: holds zset (unused; routes the call to the {stock} slot)
+# ARGV: mode ('nx' = seed only if missing, 'xx' = only if present), then one
+#       group of product_id, database stock
+# Sets avail to database stock minus what is currently held.
+SYNC_STOCK = """
+local synced = 0
+for i = 2, #ARGV, 2 do
+    local avail_key = '{stock}:avail:' .. ARGV[i]
+    local exists = redis.call('EXISTS', avail_key) == 1
+    if (ARGV[1] == 'nx' and not exists) or (ARGV[1] == 'xx' and exists) then
+        local held = tonumber(redis.call('GET', '{stock}:held:' .. ARGV[i]) or 0)
+        redis.call('SET', avail_key, math.max(tonumber(ARGV[i + 1]) - held, 0))
+        synced = synced + 1
+    end
+end
+return synced
+"""
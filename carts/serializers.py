@@ -49,3 +49,24 @@ class AddCartItemSerializer(serializers.Serializer):
         except Product.DoesNotExist:
             raise serializers.ValidationError("Product does not exist.")
         return value
+
+
+class CartOperationSerializer(serializers.Serializer):
+    OPERATIONS = ["add", "update", "remove"]
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.CharField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 100
+
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                f"At most {self.MAX_OPERATIONS} operations per request."
+            )
+        return value
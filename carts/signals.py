@@ -0,0 +1,39 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from product.models import Product
+
+from .celery_tasks import reprice_product_carts
+
+
+@receiver(post_init, sender=Product)
+def remember_loaded_price(sender, instance, **kwargs):
+    # A deferred price (.only(), .defer()) is not in __dict__; reading it would query
+    instance._loaded_price = instance.__dict__.get("price")
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_price(sender, instance, update_fields=None, **kwargs):
+    instance._previous_price = None
+    if instance._state.adding or (update_fields is not None and "price" not in update_fields):
+        return
+    instance._previous_price = getattr(instance, "_loaded_price", None)
+    if instance._previous_price is None:
+        # Only when the price was not loaded with the instance
+        instance._previous_price = (
+            Product.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts_on_price_change(sender, instance, created, update_fields=None, **kwargs):
+    previous = getattr(instance, "_previous_price", None)
+    if previous is not None and Decimal(str(instance.price)) != previous:
+        product_id = instance.pk
+        transaction.on_commit(lambda: reprice_product_carts.delay(product_id))
+    if update_fields is None or "price" in update_fields:
+        # What a later save of this instance compares against
+        instance._loaded_price = Decimal(str(instance.price))
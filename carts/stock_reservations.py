@@ -0,0 +1,168 @@
+"""
+Stock reservations held in Redis while an order waits for payment.
+
+Checkout reserves every line of the order in one script call (all or
+nothing) against per-product available counters, so concurrent checkouts
+for a hot product never wait on Postgres row locks. A reservation is:
+- committed when the payment is processed (the units were sold and
+  Postgres stock is decremented),
+- released when the payment fails, or when it is still open after
+  STOCK_RESERVATION_TTL seconds (release_expired_reservations).
+
+Settling (commit or release) is the only way a hold goes away and the only
+thing that takes units off the held counters. Available counters are
+seeded from Postgres on first use and corrected by reconcile_stock(), which
+resets them to database stock minus held units and never touches held.
+
+All stock keys share the {stock} hash tag, so on Redis Cluster or shards
+they live together on one server and reservations stay atomic.
+"""
+
+import time
+
+from django.conf import settings
+
+from product.models import Product
+
+from .redis_cart import _get_script
+from .redis_client import client_for, group_by_client
+
+HOLDS_KEY = "{stock}:holds"
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+
+
+def _hold_key(hold_id):
+    return f"{{stock}}:hold:{hold_id}"
+
+
+def _avail_key(product_id):
+    return f"{{stock}}:avail:{product_id}"
+
+
+def _client():
+    return client_for(HOLDS_KEY)
+
+
+def _seed_stock(product_ids):
+    """
+    Create the missing counters from Postgres (one query).
+    """
+    args = ["nx"]
+    for pid, stock in Product.objects.filter(id__in=product_ids).values_list("id", "stock"):
+        args.extend([pid, stock])
+    _get_script("SYNC_STOCK")(keys=[HOLDS_KEY], args=args, client=_client())
+
+
+# -------------------- RESERVE --------------------
+def reserve_stock(hold_id, quantities, ttl=None):
+    """
+    Hold `quantities` ({product_id: quantity}) under `hold_id` (the order id).
+    Raises InsufficientStock if any line cannot be covered; nothing is held
+    in that case. Reserving the same hold_id twice is a no-op.
+    """
+    ttl = ttl or settings.STOCK_RESERVATION_TTL
+    args = [int(time.time()) + ttl]
+    for pid, qty in sorted(quantities.items()):
+        args.extend([str(pid), int(qty)])
+
+    keys = [HOLDS_KEY, _hold_key(hold_id)]
+    seeded = False
+    while True:
+        result = [
+            value.decode() if isinstance(value, bytes) else value
+            for value in _get_script("RESERVE_STOCK")(keys=keys, args=args, client=_client())
+        ]
+        if result[0] == "ok":
+            return
+        if result[0] == "missing" and not seeded:
+            _seed_stock(list(quantities))
+            seeded = True
+            continue
+        raise InsufficientStock(result[1])
+
+
+# -------------------- COMMIT / RELEASE --------------------
+def commit_stock(hold_id):
+    """
+    The held units were sold: drop the hold without returning them.
+    Returns True if the hold was still open.
+    """
+    return bool(
+        _get_script("SETTLE_STOCK")(
+            keys=[HOLDS_KEY, _hold_key(hold_id)], args=["0"], client=_client()
+        )
+    )
+
+
+def release_stock(hold_id):
+    """
+    Give the held units back (payment failed, checkout aborted).
+    Returns True if the hold was still open.
+    """
+    return bool(
+        _get_script("SETTLE_STOCK")(
+            keys=[HOLDS_KEY, _hold_key(hold_id)], args=["1"], client=_client()
+        )
+    )
+
+
+def release_expired_reservations(limit=500):
+    """
+    Release holds past their expiry. Returns how many were released.
+    """
+    hold_keys = _client().zrangebyscore(HOLDS_KEY, "-inf", time.time(), start=0, num=limit)
+    if not hold_keys:
+        return 0
+    script = _get_script("SETTLE_STOCK")
+    [(client, _)] = group_by_client([HOLDS_KEY])
+    pipe = client.pipeline(transaction=False)
+    for hold_key in hold_keys:
+        script(keys=[HOLDS_KEY, hold_key], args=["1"], client=pipe)
+    return sum(1 for settled in pipe.execute() if settled)
+
+
+# -------------------- READ / RECONCILE --------------------
+def get_available_stock(product_ids):
+    """
+    Units that can still be reserved, per product.
+    Returns {product_id: units}; products without a counter are left out.
+    """
+    product_ids = [str(pid) for pid in product_ids]
+    if not product_ids:
+        return {}
+    values = _client().mget([_avail_key(pid) for pid in product_ids])
+    return {pid: int(value) for pid, value in zip(product_ids, values) if value is not None}
+
+
+def reconcile_stock(batch_size=500):
+    """
+    Reset every existing counter to Postgres stock minus held units.
+    Products are read in primary key order, `batch_size` per query, and each
+    batch is synced in one script call. Returns the number of counters reset.
+    """
+    script = _get_script("SYNC_STOCK")
+    synced = 0
+    last_id = ""
+    while True:
+        rows = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "stock")[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        args = ["xx"]
+        for pid, stock in rows:
+            args.extend([pid, stock])
+        synced += script(keys=[HOLDS_KEY], args=args, client=_client())
+
+        if len(rows) < batch_size:
+            break
+    return synced
@@ -1,3 +1,656 @@
-from django.test import TestCase
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import shortuuid
+from django.conf import settings
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ecommerce_api.core.paginator import ApproximateCountPaginator
+from orders.celery_tasks import initialize_order_payment
+from orders.models import Order
+from orders.paystack_stub import STUB_CHECKOUT_URL
+from product.models import Category, Product
+from product.services.stock import decrement_stock
+from services.models import ShippingAddress
+from users.models import User
+
+from .cart_events import (
+    EVENTS_STREAM_KEY,
+    ROLLUP_CONSUMER,
+    ROLLUP_GROUP,
+    roll_up_cart_events,
+)
+from .cart_sweeper import abandoned_cart_stats, purge_inactive_carts, sweep_redis_carts
+from .cart_sync import user_cart_key
+from .celery_tasks import flush_dirty_carts
+from .guest_tokens import GUEST_TOKEN_HEADER
+from .models import Cart, CartEventRollup, CartItem
+from .redis_cart import (
+    CART_FORMAT_VERSION,
+    CART_TTL,
+    CartVersionConflict,
+    _redis_key,
+    add_or_increment_cart_item,
+    clear_cart,
+    get_cart,
+    get_cart_ttls,
+    save_cart,
+    scan_product_carts,
+    set_cart_item,
+)
+from .redis_client import client_for
+from .stock_reservations import (
+    HOLDS_KEY,
+    commit_stock,
+    get_available_stock,
+    reconcile_stock,
+    release_expired_reservations,
+    reserve_stock,
+)
+from .views import CartViewSet
+
+PAYSTACK_OK = {
+    "status": True,
+    "data": {"authorization_url": "https://paystack.test/pay", "access_code": "ac"},
+}
+
+
+class CartTestCase(TestCase):
+    """
+    A user, a logged-in client and two products. Redis keys are per user and
+    product id, so tests do not see each other's carts.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com",
+            password="pw",
+            username="buyer",
+            phone_number="+2348030000001",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Books")
+        self.p1, self.p2 = [
+            Product.objects.create(
+                owner=self.user, category=category, name=name, price=price, stock=10
+            )
+            for name, price in (("P1", Decimal("10.50")), ("P2", Decimal("22.50")))
+        ]
+        self.address = ShippingAddress.objects.create(
+            user=self.user, full_name="Buyer", phone="1", address="1 Road", city="C", state="S"
+        )
+
+    def add(self, product, quantity=1, **extra):
+        return self.client.post(
+            "/api/cart/add_item/", {"product_id": product.id, "quantity": quantity}, **extra
+        )
+
+    def checkout(self):
+        with mock.patch("carts.views.initialize_transaction", return_value=PAYSTACK_OK):
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(
+                    "/api/cart/checkout/", {"shipping_address_id": self.address.id}
+                )
+
+
+@override_settings(CART_WRITE_BEHIND=True)
+class WriteBehindCheckoutTests(CartTestCase):
+    def test_flush_after_checkout_keeps_only_new_lines(self):
+        self.add(self.p1, 2)
+        self.assertEqual(self.checkout().status_code, 200)
+
+        response = self.add(self.p2)
+        self.assertEqual(list(response.json()["items"]), [self.p2.id])
+
+        flush_dirty_carts()
+        cart = Cart.objects.get(user=self.user, is_active=True)
+        self.assertEqual(list(cart.items.values_list("product_id", "quantity")), [(self.p2.id, 1)])
+        self.assertEqual((cart.total_amount, cart.item_count), (Decimal("22.50"), 1))
+
+
+class ClosedCartTests(CartTestCase):
+    def test_checkout_clears_redis_cart(self):
+        self.add(self.p1, 2)
+        self.assertEqual(self.checkout().status_code, 200)
+
+        self.assertEqual(self.client.get("/api/cart/").json()["items"], {})
+        response = self.add(self.p2)
+        self.assertEqual(list(response.json()["items"]), [self.p2.id])
+        cart = Cart.objects.get(user=self.user, is_active=True)
+        self.assertEqual((cart.total_amount, cart.item_count), (Decimal("22.50"), 1))
+
+    def test_removing_last_item_closes_both_carts(self):
+        self.add(self.p1)
+        self.client.post("/api/cart/remove_item/", {"product_id": self.p1.id})
+
+        self.assertFalse(Cart.objects.filter(user=self.user, is_active=True).exists())
+        self.assertEqual(get_cart(user_cart_key(self.user.id)), {})
+
+
+class CartMergeTests(CartTestCase):
+    def test_guest_cart_is_folded_into_the_user_cart(self):
+        guest = APIClient()
+        guest.post("/api/cart/add_item/", {"product_id": self.p1.id, "quantity": 2})
+        guest.post("/api/cart/add_item/", {"product_id": self.p2.id})
+        self.add(self.p2)
+
+        response = self.client.post("/api/cart/merge/", {"session_key": guest.session.session_key})
+        self.assertEqual(
+            {pid: item["quantity"] for pid, item in response.json()["items"].items()},
+            {self.p1.id: 2, self.p2.id: 2},
+        )
+        self.assertEqual(response.json()["item_count"], 4)
+        self.assertEqual(guest.get("/api/cart/").json()["items"], {})
+        cart = Cart.objects.get(user=self.user, is_active=True)
+        self.assertEqual(
+            sorted(cart.items.values_list("product_id", "quantity")),
+            sorted([(self.p1.id, 2), (self.p2.id, 2)]),
+        )
+
+    def test_another_users_cart_cannot_be_merged(self):
+        response = self.client.post(
+            "/api/cart/merge/", {"session_key": user_cart_key(self.user.id)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class CartBatchTests(CartTestCase):
+    def batch(self, *operations, **extra):
+        return self.client.post(
+            "/api/cart/batch/", {"operations": list(operations)}, format="json", **extra
+        )
+
+    def quantities(self):
+        return {
+            pid: line["quantity"] for pid, line in get_cart(user_cart_key(self.user.id)).items()
+        }
+
+    def test_operations_are_applied_in_order(self):
+        response = self.batch(
+            {"op": "add", "product_id": self.p1.id, "quantity": 2},
+            {"op": "add", "product_id": self.p1.id},
+            {"op": "update", "product_id": self.p2.id, "quantity": 4},
+            {"op": "remove", "product_id": self.p2.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.p1.id: 3})
+        cart = Cart.objects.get(user=self.user, is_active=True)
+        self.assertEqual(list(cart.items.values_list("product_id", "quantity")), [(self.p1.id, 3)])
+
+    def test_one_invalid_operation_changes_nothing(self):
+        self.add(self.p1)
+        response = self.batch(
+            {"op": "add", "product_id": self.p1.id},
+            {"op": "update", "product_id": self.p2.id, "quantity": 11},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.p1.id: 1})
+
+        response = self.batch(
+            {"op": "add", "product_id": self.p2.id},
+            {"op": "add", "product_id": "missing"},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["product_ids"], ["missing"])
+        self.assertEqual(self.quantities(), {self.p1.id: 1})
+
+    def test_if_match_stale_version_is_412(self):
+        stale = self.add(self.p1)["ETag"]
+        current = self.add(self.p1)["ETag"]
+
+        response = self.batch({"op": "remove", "product_id": self.p1.id}, HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response["ETag"], current)
+        self.assertEqual(self.quantities(), {self.p1.id: 2})
+
+        response = self.batch({"op": "add", "product_id": self.p2.id}, HTTP_IF_MATCH=current)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.p1.id: 2, self.p2.id: 1})
+
+
+@override_settings(GUEST_CART_TOKENS=True)
+class GuestCartTokenTests(CartTestCase):
+    def test_reads_create_no_session_or_token(self):
+        guest = APIClient()
+        for url in ("/api/cart/", "/api/cart/summary/"):
+            response = guest.get(url)
+            self.assertEqual(response.json()["item_count"], 0)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+            self.assertNotIn(GUEST_TOKEN_HEADER, response)
+
+        response = guest.post("/api/cart/add_item/", {"product_id": "missing"})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(GUEST_TOKEN_HEADER, response)
+
+    def test_first_write_issues_the_token(self):
+        guest = APIClient()
+        response = guest.post("/api/cart/add_item/", {"product_id": self.p1.id, "quantity": 2})
+        token = response[GUEST_TOKEN_HEADER]
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(response.cookies[settings.GUEST_CART_COOKIE_NAME].value, token)
+
+        # The cookie carries the cart; only the first write sends a token
+        response = guest.post("/api/cart/add_item/", {"product_id": self.p2.id})
+        self.assertEqual(response.json()["item_count"], 3)
+        self.assertNotIn(GUEST_TOKEN_HEADER, response)
+
+        header_only = APIClient()
+        response = header_only.get("/api/cart/", HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.json()["item_count"], 3)
+        response = header_only.get("/api/cart/", HTTP_X_CART_TOKEN=token + "x")
+        self.assertEqual(response.json()["item_count"], 0)
+
+        self.client.cookies = guest.cookies
+        response = self.client.post("/api/cart/merge/")
+        self.assertEqual(response.json()["item_count"], 3)
+
+
+class IdempotentReplayTests(CartTestCase):
+    def test_retry_replays_body_and_headers(self):
+        first = self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")
+        retry = self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")
+
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["ETag"], first["ETag"])
+        self.assertEqual(get_cart(user_cart_key(self.user.id))[self.p1.id]["quantity"], 1)
+
+    def test_first_response_is_finalized_once(self):
+        with mock.patch(
+            "carts.views.CartViewSet.finalize_response",
+            autospec=True,
+            side_effect=CartViewSet.finalize_response,
+        ) as finalize:
+            first = self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")
+        self.assertEqual(finalize.call_count, 1)
+
+        retry = self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")
+        self.assertEqual(retry.content, first.content)
+
+    @override_settings(GUEST_CART_TOKENS=True)
+    def test_retry_replays_guest_token(self):
+        guest = APIClient()
+        token = guest.post("/api/cart/add_item/", {"product_id": self.p1.id})["X-Cart-Token"]
+
+        first, retry = [
+            APIClient().post(
+                "/api/cart/add_item/",
+                {"product_id": self.p2.id},
+                HTTP_X_CART_TOKEN=token,
+                HTTP_IDEMPOTENCY_KEY="add-p2",
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry["ETag"], first["ETag"])
+        self.assertEqual(retry.content, first.content)
+
+
+class RepriceSignalTests(CartTestCase):
+    def save(self, product):
+        with mock.patch("carts.signals.reprice_product_carts") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                # Just the UPDATE: the old price is the one loaded with the instance
+                with self.assertNumQueries(1):
+                    product.save()
+        return task.delay.call_count
+
+    def test_price_change_reprices_carts(self):
+        product = Product.objects.get(pk=self.p1.pk)
+        product.price = Decimal("11.00")
+        self.assertEqual(self.save(product), 1)
+        self.assertEqual(self.save(product), 0)
+
+        product.name = "Renamed"
+        self.assertEqual(self.save(product), 0)
+
+
+class ProductIndexTests(CartTestCase):
+    def indexed(self, product):
+        return scan_product_carts(product.id)[1]
+
+    def test_cart_scripts_keep_the_product_index(self):
+        key = user_cart_key(self.user.id)
+        self.add(self.p1)
+        self.add(self.p2)
+        self.assertEqual((self.indexed(self.p1), self.indexed(self.p2)), ([key], [key]))
+
+        self.client.post("/api/cart/remove_item/", {"product_id": self.p1.id})
+        self.assertEqual((self.indexed(self.p1), self.indexed(self.p2)), ([], [key]))
+
+
+class CartEventTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        # Whatever earlier tests left in the stream
+        roll_up_cart_events()
+
+    def totals(self, event, product):
+        return CartEventRollup.objects.filter(event=event, product_id=product.id).aggregate(
+            count=Sum("count"), quantity=Sum("quantity")
+        )
+
+    def test_events_are_rolled_up_per_product(self):
+        self.add(self.p1, 2)
+        self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")
+        self.add(self.p1, HTTP_IDEMPOTENCY_KEY="add-p1")  # replayed, not counted
+        self.client.post(
+            "/api/cart/batch/",
+            {
+                "operations": [
+                    {"op": "add", "product_id": self.p2.id},
+                    {"op": "remove", "product_id": self.p1.id},
+                ]
+            },
+            format="json",
+        )
+
+        self.assertEqual(roll_up_cart_events(batch_size=2), 3)
+        self.assertEqual(self.totals("add", self.p1), {"count": 2, "quantity": 3})
+        self.assertEqual(self.totals("add", self.p2), {"count": 1, "quantity": 1})
+        self.assertEqual(self.totals("remove", self.p1), {"count": 1, "quantity": 0})
+
+    def test_unacknowledged_entries_are_replayed(self):
+        self.add(self.p1, 2)
+        # A run that read the entry but died before XACK
+        client_for(EVENTS_STREAM_KEY).xreadgroup(
+            ROLLUP_GROUP, ROLLUP_CONSUMER, {EVENTS_STREAM_KEY: ">"}
+        )
+        self.add(self.p1)
+
+        self.assertEqual(roll_up_cart_events(), 2)
+        self.assertEqual(self.totals("add", self.p1), {"count": 2, "quantity": 3})
+        self.assertEqual(roll_up_cart_events(), 0)
+
+
+class StockReservationTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.user, total=Decimal("31.50"), shipping_cost=Decimal("0.00")
+        )
+
+    def held(self, product):
+        return client_for(HOLDS_KEY).get(f"{{stock}}:held:{product.id}")
+
+    def test_expired_hold_is_released_then_reconciled(self):
+        reserve_stock(self.order.id, {self.p1.id: 3}, ttl=60)
+        self.assertEqual(get_available_stock([self.p1.id]), {self.p1.id: 7})
+        self.assertEqual(self.held(self.p1), "3")
+
+        self.assertEqual(release_expired_reservations(), 0)
+        with mock.patch("carts.stock_reservations.time.time", return_value=time.time() + 61):
+            self.assertEqual(release_expired_reservations(), 1)
+        self.assertIsNone(self.held(self.p1))
+        self.assertEqual(get_available_stock([self.p1.id]), {self.p1.id: 10})
+
+        reconcile_stock()
+        self.assertEqual(get_available_stock([self.p1.id]), {self.p1.id: 10})
+        self.assertIsNone(self.held(self.p1))
+
+    def test_sold_hold_leaves_nothing_held(self):
+        reserve_stock(self.order.id, {self.p1.id: 3})
+        self.assertTrue(commit_stock(self.order.id))
+        self.assertFalse(commit_stock(self.order.id))
+        Product.objects.filter(id=self.p1.id).update(stock=7)  # as the paid order does
+
+        reconcile_stock()
+        self.assertIsNone(self.held(self.p1))
+        self.assertEqual(get_available_stock([self.p1.id]), {self.p1.id: 7})
+
+
+class CartSweeperTests(CartTestCase):
+    def test_only_orphaned_redis_carts_are_deleted(self):
+        guest = APIClient()
+        guest.post("/api/cart/add_item/", {"product_id": self.p1.id})
+        self.add(self.p1)
+        orphan = shortuuid.uuid()
+        save_cart(orphan, {self.p1.id: {"quantity": 1, "price_snapshot": "10.50"}})
+        user_key = user_cart_key(self.user.id)
+        client_for(_redis_key(user_key)).persist(_redis_key(user_key))
+
+        stats = sweep_redis_carts()
+        self.assertGreaterEqual(stats["orphaned_deleted"], 1)
+        self.assertEqual(get_cart(orphan), {})
+        self.assertEqual(guest.get("/api/cart/").json()["item_count"], 1)
+        self.assertEqual(get_cart_ttls([user_key])[user_key], CART_TTL)
+
+    def test_only_old_inactive_db_carts_are_purged(self):
+        long_ago = timezone.now() - timedelta(days=40)
+        carts = {}
+        for name, is_active, updated_at in (
+            ("old_inactive", False, long_ago),
+            ("recent_inactive", False, timezone.now()),
+            ("old_active", True, long_ago),
+        ):
+            cart = Cart.objects.create(
+                user=self.user, is_active=is_active, total_amount=Decimal("10.50"), item_count=1
+            )
+            CartItem.objects.create(cart=cart, product=self.p1, quantity=1)
+            Cart.objects.filter(id=cart.id).update(updated_at=updated_at)
+            carts[name] = cart.id
+
+        purged = purge_inactive_carts(timezone.now() - timedelta(days=30), delete_batch_size=1)
+        self.assertEqual(purged, (1, 1))
+        self.assertEqual(
+            set(Cart.objects.values_list("id", flat=True)),
+            {carts["recent_inactive"], carts["old_active"]},
+        )
+        self.assertEqual(
+            abandoned_cart_stats(timezone.now() - timedelta(hours=24)),
+            {"abandoned_carts": 1, "abandoned_items": 1, "abandoned_value": 10.5},
+        )
+
+
+class StockDecrementTests(CartTestCase):
+    def stock(self):
+        return [Product.objects.get(id=product.id).stock for product in (self.p1, self.p2)]
+
+    def test_oversell_changes_nothing(self):
+        self.assertEqual(decrement_stock({self.p2.id: 3, self.p1.id: 11}), [self.p1.id])
+        self.assertEqual(self.stock(), [10, 10])
+
+    def test_rows_are_locked_in_id_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(decrement_stock({self.p2.id: 3, self.p1.id: 4}), [])
+        self.assertEqual(self.stock(), [6, 7])
+
+        select, update = [query["sql"] for query in queries]
+        # values_list() orders by column position: 1 is the id
+        self.assertRegex(select, r'ORDER BY (1|"product_product"\."id") ASC')
+        if connection.features.has_select_for_update:
+            self.assertIn("FOR UPDATE", select)
+        self.assertTrue(update.startswith('UPDATE "product_product"'))
+
+
+class CheckoutQueryTests(CartTestCase):
+    def test_checkout_query_count_does_not_grow_with_lines(self):
+        self.add(self.p1, 2)
+        self.add(self.p2)
+        # cart, its items with products, the address, stock counters seeded
+        # from Postgres (first use only), savepoint, order, order items (one
+        # bulk INSERT), cart items, cart, savepoint
+        with self.assertNumQueries(10):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(id=response.json()["order_id"])
+        self.assertEqual(order.items.count(), 2)
+
+
+class CartVersionTests(CartTestCase):
+    def test_if_none_match_current_version_is_304(self):
+        etag = self.add(self.p1)["ETag"]
+
+        response = self.client.get("/api/cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        self.add(self.p2)
+        response = self.client.get("/api/cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_match_stale_version_is_412(self):
+        stale = self.add(self.p1)["ETag"]
+        current = self.add(self.p1)["ETag"]
+
+        response = self.add(self.p2, HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response["ETag"], current)
+        self.assertNotIn(self.p2.id, get_cart(user_cart_key(self.user.id)))
+
+        self.assertEqual(self.add(self.p2, HTTP_IF_MATCH=current).status_code, 200)
+
+    def test_expired_cart_is_listed_from_the_db(self):
+        self.add(self.p1, 2)
+        clear_cart(user_cart_key(self.user.id))
+
+        response = self.client.get("/api/cart/", HTTP_IF_NONE_MATCH='"0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()["items"]), [self.p1.id])
+        self.assertEqual(response.json()["item_count"], 2)
+        etag = response["ETag"]
+        self.assertNotEqual(etag, '"0"')
+        self.assertEqual(self.client.get("/api/cart/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_stale_expected_version_is_a_conflict(self):
+        key = user_cart_key(self.user.id)
+        cart = add_or_increment_cart_item(key, self.p1.id, 1, self.p1.price)
+        add_or_increment_cart_item(key, self.p1.id, 1, self.p1.price)
+
+        with self.assertRaises(CartVersionConflict):
+            set_cart_item(key, self.p2.id, 1, self.p2.price, expected_version=cart.version)
+        self.assertEqual(list(get_cart(key)), [self.p1.id])
+
+
+class CartFormatUpgradeTests(CartTestCase):
+    def redis_key(self):
+        return _redis_key(user_cart_key(self.user.id))
+
+    def assertUpgraded(self):
+        cart = get_cart(user_cart_key(self.user.id))
+        self.assertEqual(
+            cart[self.p1.id], {"quantity": 2, "price_snapshot": 10.5, "subtotal": 21.0}
+        )
+        self.assertEqual((cart.total, cart.item_count), (21.0, 2))
+        client = client_for(self.redis_key())
+        self.assertEqual(client.hget(self.redis_key(), "_v"), str(CART_FORMAT_VERSION))
+        self.assertGreater(client.ttl(self.redis_key()), 0)
+
+    def test_json_cart_is_upgraded(self):
+        value = {self.p1.id: {"quantity": 2, "price_snapshot": 10.5, "subtotal": 21.0}}
+        client_for(self.redis_key()).set(self.redis_key(), json.dumps(value), ex=600)
+        self.assertUpgraded()
+
+    def test_hash_cart_is_upgraded(self):
+        client = client_for(self.redis_key())
+        client.hset(self.redis_key(), mapping={f"q:{self.p1.id}": 2, f"p:{self.p1.id}": 10.5})
+        client.expire(self.redis_key(), 600)
+        self.assertUpgraded()
+
+
+@override_settings(PAYMENT_INIT_ASYNC=True, PAYSTACK_STUB=True, PAYSTACK_STUB_DELAY=0)
+class AsyncPaymentInitTests(CartTestCase):
+    def test_client_polls_until_payment_is_initialized(self):
+        self.add(self.p1)
+        with mock.patch("carts.views.initialize_order_payment") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    "/api/cart/checkout/", {"shipping_address_id": self.address.id}
+                )
+        self.assertEqual(response.status_code, 202)
+        order_id = response.json()["order_id"]
+        task.delay.assert_called_once_with(order_id)
+
+        poll_url = response.json()["payment_status_url"]
+        response = self.client.get(poll_url)
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertEqual(response["Retry-After"], "1")
+
+        initialize_order_payment(order_id)
+        response = self.client.get(poll_url)
+        self.assertEqual(response.json()["status"], "ready")
+        self.assertTrue(response.json()["authorization_url"].startswith(STUB_CHECKOUT_URL))
+
+
+class ApproximateCountPaginatorTests(CartTestCase):
+    @mock.patch("ecommerce_api.core.paginator.EXACT_COUNT_THRESHOLD", 2)
+    def test_pages_past_a_capped_count_are_served(self):
+        category = self.p1.category
+        for i in range(3):
+            Product.objects.create(owner=self.user, category=category, name=f"P{i}", price=1)
+        products = Product.objects.filter(owner=self.user).order_by("id")
+        paginator = ApproximateCountPaginator(products, 2)
+
+        self.assertEqual(paginator.count, 3)  # capped at threshold + 1; there are 5
+        self.assertEqual(len(paginator.page(3).object_list), 1)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+
+class CartAdminTests(CartTestCase):
+    def test_editing_items_inline_updates_cart_totals(self):
+        cart = Cart.objects.create(user=self.user)
+        items = [
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            for product in (self.p1, self.p2)
+        ]
+        admin_user = User.objects.create_superuser(
+            email="admin@example.com",
+            password="pw",
+            username="admin",
+            phone_number="+2348030000009",
+        )
+        self.client.force_login(admin_user)
+
+        data = {
+            "user": self.user.pk,
+            "is_active": "on",
+            "items-TOTAL_FORMS": "2",
+            "items-INITIAL_FORMS": "2",
+            "items-MIN_NUM_FORMS": "0",
+            "items-MAX_NUM_FORMS": "1000",
+        }
+        for i, (item, quantity) in enumerate(zip(items, (3, 1))):
+            data.update(
+                {
+                    f"items-{i}-id": item.pk,
+                    f"items-{i}-cart": cart.pk,
+                    f"items-{i}-product": item.product_id,
+                    f"items-{i}-quantity": quantity,
+                }
+            )
+        data["items-1-DELETE"] = "on"
+        response = self.client.post(f"/admin/carts/cart/{cart.pk}/change/", data)
+        self.assertEqual(response.status_code, 302)
+
+        cart.refresh_from_db()
+        self.assertEqual((cart.total_amount, cart.item_count), (Decimal("31.50"), 3))
+
+
+class CartSummaryTests(CartTestCase):
+    def summary(self, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get("/api/cart/summary/").json()
+
+    def test_empty_cart_summary_writes_nothing(self):
+        for _ in range(2):
+            self.assertEqual(self.summary(1), {"total": 0.0, "item_count": 0})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_expired_cart_is_rebuilt_once(self):
+        self.add(self.p1, 2)
+        clear_cart(user_cart_key(self.user.id))
+
+        self.assertEqual(self.summary(1), {"total": 21.0, "item_count": 2})
+        self.assertEqual(self.summary(0), {"total": 21.0, "item_count": 2})
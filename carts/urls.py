@@ -1,11 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CartViewSet
+from .views import CartViewSet, MergeCartAPIView
 
 router = DefaultRouter()
 router.register(r"cart", CartViewSet, basename="cart")
 
 urlpatterns = [
+    path("cart/merge/", MergeCartAPIView.as_view(), name="cart-merge"),
     path("", include(router.urls)),
 ]
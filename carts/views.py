@@ -1,21 +1,110 @@
+import shortuuid
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.views import APIView
+from ecommerce_api.core.idempotency import idempotent
 from ecommerce_api.core.throttles import ComboRateThrottle
 
+from orders.celery_tasks import initialize_order_payment
 from orders.models import Order, OrderItem
 from orders.utils import initialize_transaction
 from product.models import Product
+from product.services.product_summaries import get_product_summaries
 from services.models import Shipment, ShippingAddress
 from services.shipping_service import calculate_shipping_fee
 
-from .celery_tasks import process_order_after_payment as process_order_shipment
+from .cart_events import records_cart_event
+from .cart_sync import (
+    discard_user_cart,
+    flush_user_cart,
+    load_user_cart,
+    store_cart_totals,
+    user_cart_key,
+)
+from .celery_tasks import (
+    process_order_after_payment as process_order_shipment,
+    sync_user_cart,
+)
+from .guest_tokens import (
+    guest_cart_key_from_request,
+    new_guest_cart_key,
+    set_guest_cart_token,
+)
 from .models import Cart, CartItem
 from .permissions import CartPermission
-from .redis_cart import clear_cart, get_cart as redis_get_cart, save_cart
+from .serializers import CartBatchSerializer
+from .stock_reservations import InsufficientStock, release_stock, reserve_stock
+from .redis_cart import (
+    CartData,
+    CartVersionConflict,
+    add_or_increment_cart_item,
+    apply_cart_operations,
+    get_cart as redis_get_cart,
+    get_cart_version,
+    get_cart_totals,
+    merge_carts,
+    remove_cart_item,
+    set_cart_item,
+    to_minor_units,
+    update_cart_item,
+)
+
+
+def cart_etag(version):
+    return f'"{version}"'
+
+
+def parse_etags(header):
+    """
+    Versions listed in an If-Match / If-None-Match header ("*" kept as is).
+    """
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
+def cart_payload(cart_data):
+    # Totals are maintained in Redis by every write; no need to re-add lines
+    return {
+        "items": cart_data,
+        "total": cart_data.total,
+        "item_count": cart_data.item_count,
+    }
+
+
+def expand_products(payload, request):
+    """
+    Embed a summary of each product in the cart lines and flag lines whose
+    price snapshot no longer matches the current price. All products come
+    from one cache MGET plus, for misses, one query.
+    """
+    summaries = get_product_summaries(payload["items"])
+    items = {}
+    for pid, item in payload["items"].items():
+        product = summaries.get(pid)
+        if product and product["image"]:
+            product = {**product, "image": request.build_absolute_uri(product["image"])}
+        items[pid] = {
+            **item,
+            "product": product,
+            "price_changed": bool(product)
+            and to_minor_units(product["price"]) != to_minor_units(item["price_snapshot"]),
+        }
+    payload["items"] = items
+    payload["price_changed"] = any(item["price_changed"] for item in items.values())
+    return payload
 
 
 class CartViewSet(viewsets.ViewSet):
@@ -25,22 +114,65 @@ class CartViewSet(viewsets.ViewSet):
     # ------------------- LIST CART -------------------
     @swagger_auto_schema(
         operation_summary="Get cart",
-        operation_description="Retrieve the current cart (guest or authenticated).",
-        responses={200: "Cart retrieved successfully"},
+        operation_description=(
+            "Retrieve the current cart (guest or authenticated). The response "
+            "carries the cart version as ETag; send it back in If-None-Match "
+            "to get 304 when nothing changed. With ?expand=product every line "
+            "also carries the product's name, slug, image and current price and "
+            "stock, and price_changed flags lines whose price moved since they "
+            "were added (expanded responses are never answered with 304)."
+        ),
+        responses={200: "Cart retrieved successfully", 304: "Cart not modified"},
     )
     def list(self, request):
+        # Reading never creates a guest session or token
+        key = self.get_cart_key(request, create=False)
+        expand = request.query_params.get("expand") == "product"
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and not expand:
+            # Only the version is read; the items are left in Redis
+            version = get_cart_version(key) if key else CartData().version
+            if version == CartData().version and request.user.is_authenticated:
+                # Expired in Redis: the ETag must be that of the cart rebuilt below
+                version = load_user_cart(request.user).version
+            tags = parse_etags(if_none_match)
+            if "*" in tags or version in tags:
+                return Response(
+                    status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cart_etag(version)}
+                )
+
         if request.user.is_authenticated:
-            key = f"user:{request.user.id}"
+            # Rebuilds the Redis cart from the DB if it expired, like summary
+            cart_data = load_user_cart(request.user)
         else:
-            key = request.session.session_key
-            if not key:
-                request.session.create()
-                key = request.session.session_key
-
-        cart_data = redis_get_cart(key) or {}
-        total = sum(item.get("subtotal", 0) for item in cart_data.values())
+            cart_data = redis_get_cart(key) if key else CartData()
+        if expand:
+            return Response(
+                expand_products(cart_payload(cart_data), request),
+                status=status.HTTP_200_OK,
+                headers={"ETag": cart_etag(cart_data.version)},
+            )
+        return self.cart_response(cart_data)
 
-        return Response({"items": cart_data, "total": total}, status=status.HTTP_200_OK)
+    # ------------------- SUMMARY -------------------
+    @swagger_auto_schema(
+        operation_summary="Get cart totals",
+        operation_description="Return only the cart total and item count (e.g. for a badge).",
+        responses={200: "Cart totals retrieved successfully"},
+    )
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        key = self.get_cart_key(request, create=False)
+        if not key:
+            return Response({"total": 0.0, "item_count": 0}, status=200)
+
+        totals = get_cart_totals(key)
+        if not totals["item_count"] and request.user.is_authenticated:
+            # Nothing in Redis: rebuild it if it expired but the DB cart has items
+            cart_data = load_user_cart(request.user)
+            totals = {"total": cart_data.total, "item_count": cart_data.item_count}
+        return Response(totals, status=200)
 
     # ------------------- ADD ITEM -------------------
     @swagger_auto_schema(
@@ -49,6 +181,8 @@ class CartViewSet(viewsets.ViewSet):
         responses={200: "Item added to cart"},
     )
     @action(detail=False, methods=["post"])
+    @idempotent
+    @records_cart_event("add")
     def add_item(self, request):
         product_id = request.data.get("product_id")
         if not product_id:
@@ -66,10 +200,26 @@ class CartViewSet(viewsets.ViewSet):
         if product.stock < quantity:
             return Response({"error": "Not enough stock"}, status=400)
 
-        cart_obj, _ = self.load_cart(request)
-
+        expected_version = self.if_match_version(request)
         if request.user.is_authenticated:
+            # Make sure Redis holds the full cart before touching one item
+            self.load_cart(request)
+
             user_key = f"user:{request.user.id}"
+            if settings.CART_WRITE_BEHIND:
+                # Redis only; flush_dirty_carts persists it later
+                cart_data = add_or_increment_cart_item(
+                    user_key,
+                    product.id,
+                    quantity,
+                    product.price,
+                    refresh_price=True,
+                    dirty=True,
+                    expected_version=expected_version,
+                )
+                return self.cart_response(cart_data)
+
+            self.check_cart_version(user_key, expected_version)
             db_cart, _ = Cart.objects.get_or_create(user=request.user, is_active=True)
             item, created = CartItem.objects.get_or_create(
                 cart=db_cart,
@@ -81,36 +231,22 @@ class CartViewSet(viewsets.ViewSet):
                 item.price_snapshot = product.price
                 item.save()
 
-            db_cart_data = {
-                str(i.product.id): {
-                    "quantity": i.quantity,
-                    "price_snapshot": float(i.price_snapshot),
-                    "subtotal": float(i.subtotal),
-                }
-                for i in db_cart.items.all()
-            }
-            save_cart(user_key, db_cart_data)
+            cart_data = set_cart_item(
+                user_key, product.id, item.quantity, item.price_snapshot
+            )
+            store_cart_totals(db_cart.pk, cart_data)
 
         else:
-            session_key = cart_obj["session_key"]
-            items = cart_obj.get("items", {}) or {}
-            pid = str(product_id)
-
-            if pid in items:
-                items[pid]["quantity"] += quantity
-            else:
-                items[pid] = {
-                    "quantity": quantity,
-                    "price_snapshot": float(product.price),
-                    "subtotal": float(product.price * quantity),
-                }
-
-            items[pid]["subtotal"] = float(
-                items[pid]["quantity"] * items[pid]["price_snapshot"]
+            session_key = self.get_cart_key(request)
+            cart_data = add_or_increment_cart_item(
+                session_key,
+                product.id,
+                quantity,
+                product.price,
+                expected_version=expected_version,
             )
-            save_cart(session_key, items)
 
-        return self.list(request)
+        return self.cart_response(cart_data)
 
     # ------------------- UPDATE ITEM -------------------
     @swagger_auto_schema(
@@ -119,6 +255,8 @@ class CartViewSet(viewsets.ViewSet):
         responses={200: "Item quantity updated"},
     )
     @action(detail=False, methods=["post"])
+    @idempotent
+    @records_cart_event("update")
     def update_item(self, request):
         product_id = request.data.get("product_id")
         if not product_id:
@@ -133,8 +271,23 @@ class CartViewSet(viewsets.ViewSet):
 
         product = get_object_or_404(Product, id=product_id)
 
+        expected_version = self.if_match_version(request)
         if request.user.is_authenticated:
+            self.load_cart(request)
+
             user_key = f"user:{request.user.id}"
+            if settings.CART_WRITE_BEHIND:
+                cart_data = set_cart_item(
+                    user_key,
+                    product.id,
+                    quantity,
+                    product.price,
+                    dirty=True,
+                    expected_version=expected_version,
+                )
+                return self.cart_response(cart_data)
+
+            self.check_cart_version(user_key, expected_version)
             db_cart, _ = Cart.objects.get_or_create(user=request.user, is_active=True)
             item, created = CartItem.objects.get_or_create(
                 cart=db_cart,
@@ -146,30 +299,24 @@ class CartViewSet(viewsets.ViewSet):
                 item.price_snapshot = product.price
                 item.save()
 
-            db_cart_data = {
-                str(i.product.id): {
-                    "quantity": i.quantity,
-                    "price_snapshot": float(i.price_snapshot),
-                    "subtotal": float(i.subtotal),
-                }
-                for i in db_cart.items.all()
-            }
-            save_cart(user_key, db_cart_data)
+            cart_data = set_cart_item(
+                user_key, product.id, item.quantity, item.price_snapshot
+            )
+            store_cart_totals(db_cart.pk, cart_data)
 
         else:
-            session_key = request.session.session_key or request.session.create()
-            items = redis_get_cart(session_key) or {}
-            pid = str(product_id)
-
-            if pid not in items:
+            session_key = self.get_cart_key(request)
+            cart_data = update_cart_item(
+                session_key,
+                product.id,
+                quantity,
+                product.price,
+                expected_version=expected_version,
+            )
+            if cart_data is None:
                 return Response({"error": "Item not in cart"}, status=400)
 
-            items[pid]["quantity"] = quantity
-            items[pid]["price_snapshot"] = float(product.price)
-            items[pid]["subtotal"] = float(quantity * product.price)
-            save_cart(session_key, items)
-
-        return self.list(request)
+        return self.cart_response(cart_data)
 
     # ------------------- REMOVE ITEM -------------------
     @swagger_auto_schema(
@@ -178,52 +325,149 @@ class CartViewSet(viewsets.ViewSet):
         responses={200: "Item removed"},
     )
     @action(detail=False, methods=["post"])
+    @idempotent
+    @records_cart_event("remove")
     def remove_item(self, request):
         product_id = request.data.get("product_id")
         if not product_id:
             return Response({"error": "product_id is required"}, status=400)
 
+        expected_version = self.if_match_version(request)
         if request.user.is_authenticated:
-            cart = Cart.objects.filter(user=request.user, is_active=True).first()
+            # Redis must hold the full cart so its totals stay right
+            self.load_cart(request)
+
             user_key = f"user:{request.user.id}"
+            if settings.CART_WRITE_BEHIND:
+                cart_data = remove_cart_item(
+                    user_key, product_id, dirty=True, expected_version=expected_version
+                )
+                return self.removed_response(cart_data)
 
+            self.check_cart_version(user_key, expected_version)
+            cart = Cart.objects.filter(user=request.user, is_active=True).first()
             if cart:
                 CartItem.objects.filter(cart=cart, product_id=product_id).delete()
                 if not cart.items.exists():
                     cart.is_active = False
                     cart.save()
+                    # A closed DB cart never leaves a Redis cart behind
+                    discard_user_cart(request.user.id)
+                    return self.removed_response(CartData())
 
-            cart_data = redis_get_cart(user_key) or {}
-            cart_data.pop(str(product_id), None)
-
-            if not cart_data:
-                clear_cart(user_key)
-            else:
-                save_cart(user_key, cart_data)
+            cart_data = remove_cart_item(user_key, product_id)
+            if cart:
+                store_cart_totals(cart.pk, cart_data)
 
         else:
-            session_key = request.session.session_key
+            session_key = self.get_cart_key(request, create=False)
             if not session_key:
                 return Response({"error": "No guest session found"}, status=400)
 
-            cart_data = redis_get_cart(session_key) or {}
-            cart_data.pop(str(product_id), None)
+            cart_data = remove_cart_item(
+                session_key, product_id, expected_version=expected_version
+            )
+
+        return self.removed_response(cart_data)
 
-            if not cart_data:
-                clear_cart(session_key)
+    # ------------------- BATCH -------------------
+    @swagger_auto_schema(
+        operation_summary="Apply several cart changes",
+        operation_description=(
+            "Apply a list of add/update/remove operations in one request. "
+            "`update` sets the quantity (adding the product if needed). "
+            "All products and stock are validated up front and the changes "
+            "are applied atomically; nothing is changed if any operation is invalid."
+        ),
+        request_body=CartBatchSerializer,
+        responses={200: "Cart updated"},
+    )
+    @action(detail=False, methods=["post"])
+    @idempotent
+    @records_cart_event("batch")
+    def batch(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data["operations"]
+
+        # One query for every product in the batch
+        product_ids = {op["product_id"] for op in operations}
+        products = Product.objects.only("id", "name", "price", "stock").in_bulk(
+            product_ids
+        )
+        missing = sorted(product_ids - set(products))
+        if missing:
+            return Response(
+                {"error": "Product not found", "product_ids": missing}, status=404
+            )
+
+        cart_obj, _ = self.load_cart(request)
+        current = cart_obj if request.user.is_authenticated else cart_obj["items"]
+        expected_version = self.if_match_version(request)
+        if expected_version and expected_version != current.version:
+            raise CartVersionConflict(current.version)
+
+        # Replay the operations on the current quantities to check stock
+        quantities = {pid: line["quantity"] for pid, line in current.items()}
+        redis_ops = []
+        for op in operations:
+            product = products[op["product_id"]]
+            if op["op"] == "add":
+                quantities[product.id] = quantities.get(product.id, 0) + op["quantity"]
+                redis_ops.append(("add", product.id, op["quantity"], product.price))
+            elif op["op"] == "update":
+                quantities[product.id] = op["quantity"]
+                redis_ops.append(("set", product.id, op["quantity"], product.price))
             else:
-                save_cart(session_key, cart_data)
+                quantities.pop(product.id, None)
+                redis_ops.append(("remove", product.id, 0, 0))
 
-        return Response({"message": "Item removed from cart"}, status=200)
+        for pid in product_ids:
+            product = products[pid]
+            if quantities.get(pid, 0) > product.stock:
+                return Response(
+                    {"error": f"Not enough stock for {product.name}"}, status=400
+                )
+
+        if request.user.is_authenticated:
+            user_key = f"user:{request.user.id}"
+            cart_data = apply_cart_operations(
+                user_key,
+                redis_ops,
+                refresh_price=True,
+                dirty=True,
+                expected_version=expected_version,
+            )
+            if not settings.CART_WRITE_BEHIND:
+                # One bulk write for the whole batch
+                flush_user_cart(request.user.id)
+        else:
+            cart_data = apply_cart_operations(
+                self.get_cart_key(request), redis_ops, expected_version=expected_version
+            )
+
+        return self.cart_response(cart_data)
 
     # ------------------- CHECKOUT -------------------
     @swagger_auto_schema(
         operation_summary="Checkout cart",
-        operation_description="Create an order and initialize payment.",
-        responses={200: "Checkout initialized"},
+        operation_description=(
+            "Create an order and initialize payment. With async payment "
+            "initialization the response is 202 and the authorization URL is "
+            "fetched from `payment_status_url`."
+        ),
+        responses={200: "Checkout initialized", 202: "Order created, payment pending"},
     )
     @action(detail=False, methods=["post"])
+    @idempotent
+    @records_cart_event("checkout")
     def checkout(self, request):
+        """
+        One pass over the cart: its items are loaded once with their products
+        (one query) and reused for stock checks, totals, shipping and order
+        items. Order, order items and cart cleanup are written in a single
+        transaction; Paystack is called after it commits.
+        """
         # Set scoped throttle dynamically
         self.throttle_classes = [ScopedRateThrottle]
         self.throttle_scope = "checkout"
@@ -232,32 +476,97 @@ class CartViewSet(viewsets.ViewSet):
         if not request.user.is_authenticated:
             return Response({"error": "Login required"}, status=401)
 
+        shipping_address_id = request.data.get("shipping_address_id")
+        if not shipping_address_id:
+            return Response({"error": "shipping_address_id is required"}, status=400)
+
+        if settings.CART_WRITE_BEHIND:
+            # Redis holds the latest cart; make Postgres catch up before reading it
+            flush_user_cart(request.user.id)
+
         cart = Cart.objects.filter(user=request.user, is_active=True).first()
-        if not cart or not cart.items.exists():
+        items = list(cart.items.select_related("product")) if cart else []
+        if not items:
             return Response({"error": "Cart is empty"}, status=400)
 
-        for item in cart.items.all():
+        for item in items:
             if item.product.stock < item.quantity:
                 return Response(
                     {"error": f"Insufficient stock for {item.product.name}"}, status=400
                 )
 
-        shipping_address_id = request.data.get("shipping_address_id")
-        if not shipping_address_id:
-            return Response({"error": "shipping_address_id is required"}, status=400)
-
         shipping_address = get_object_or_404(
             ShippingAddress, id=shipping_address_id, user=request.user
         )
 
-        subtotal = sum(item.subtotal for item in cart.items.all())
-        shipping_fee = calculate_shipping_fee(cart.items.all(), shipping_address)
-        total_amount = subtotal + shipping_fee
+        # Hold the stock in Redis until the payment succeeds, fails or times out
+        order_id = shortuuid.uuid()
+        try:
+            reserve_stock(order_id, {item.product_id: item.quantity for item in items})
+        except InsufficientStock as exc:
+            name = next(i.product.name for i in items if i.product_id == exc.product_id)
+            return Response({"error": f"Insufficient stock for {name}"}, status=400)
+
+        try:
+            order = self.create_order(request, cart, items, shipping_address, order_id)
+        except Exception:
+            release_stock(order_id)
+            raise
+
+        if settings.PAYMENT_INIT_ASYNC:
+            # Don't hold this worker while Paystack answers; the client polls
+            initialize_order_payment.delay(order.id)
+            return Response(
+                {
+                    "order_id": order.id,
+                    "reference": order.reference,
+                    "shipping_cost": order.shipping_cost,
+                    "total_amount": order.total,
+                    "payment_status_url": reverse("order-payment", args=[order.id]),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        paystack_resp = initialize_transaction(
+            request.user.email, int(order.total), order.reference
+        )
+
+        if not paystack_resp.get("status"):
+            release_stock(order.id)
+            return Response(
+                {"error": paystack_resp.get("message", "Payment failed")}, status=400
+            )
+
+        return Response(
+            {
+                "order_id": order.id,
+                "reference": order.reference,
+                "shipping_cost": order.shipping_cost,
+                "total_amount": order.total,
+                "authorization_url": paystack_resp["data"]["authorization_url"],
+                "access_code": paystack_resp["data"]["access_code"],
+            },
+            status=200,
+        )
+
+    # ------------------- CREATE ORDER -------------------
+    @transaction.atomic
+    def create_order(self, request, cart, items, shipping_address, order_id):
+        """
+        Turn the materialized cart items into an order in four queries:
+        insert the order (reference included), bulk insert its items,
+        delete the cart items and close the cart. The Redis copy of the
+        cart goes once this commits.
+        """
+        subtotal = sum(item.subtotal for item in items)
+        shipping_fee = calculate_shipping_fee(items, shipping_address)
 
         order = Order.objects.create(
+            id=order_id,
+            reference=f"ORD-{order_id}",
             user=request.user,
             cart=cart,
-            total=total_amount,
+            total=subtotal + shipping_fee,
             status="pending",
             payment_status="pending",
             shipping_full_name=shipping_address.full_name,
@@ -278,58 +587,141 @@ class CartViewSet(viewsets.ViewSet):
                     quantity=item.quantity,
                     price_snapshot=item.price_snapshot,
                 )
-                for item in cart.items.all()
+                for item in items
             ]
         )
 
-        cart.items.all().delete()
-        cart.is_active = False
-        cart.save()
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(
+            is_active=False, total_amount=0, item_count=0, updated_at=timezone.now()
+        )
+        user_id = request.user.id
+        transaction.on_commit(lambda: discard_user_cart(user_id))
+        return order
 
-        order.reference = f"ORD-{order.id}"
-        order.save()
+    # ------------------- CART RESPONSE -------------------
+    def cart_response(self, cart_data):
+        return Response(
+            cart_payload(cart_data),
+            status=status.HTTP_200_OK,
+            headers={"ETag": cart_etag(cart_data.version)},
+        )
 
-        paystack_resp = initialize_transaction(
-            request.user.email, int(order.total), order.reference
+    def removed_response(self, cart_data):
+        return Response(
+            {"message": "Item removed from cart"},
+            status=200,
+            headers={"ETag": cart_etag(cart_data.version)},
         )
 
-        if not paystack_resp.get("status"):
+    # ------------------- VERSIONING -------------------
+    def if_match_version(self, request):
+        """
+        Cart version the client based its write on (If-Match), if any.
+        """
+        tags = parse_etags(request.headers.get("If-Match", ""))
+        tags = [tag for tag in tags if tag and tag != "*"]
+        return tags[0] if tags else None
+
+    def check_cart_version(self, key, expected_version):
+        """
+        Up-front check for paths that write Postgres before Redis.
+        """
+        if expected_version:
+            current = get_cart_version(key)
+            if current != expected_version:
+                raise CartVersionConflict(current)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CartVersionConflict):
             return Response(
-                {"error": paystack_resp.get("message", "Payment failed")}, status=400
+                {"error": "Cart was changed by another request", "version": exc.current_version},
+                status=status.HTTP_412_PRECONDITION_FAILED,
+                headers={"ETag": cart_etag(exc.current_version)},
             )
+        return super().handle_exception(exc)
+
+    # ------------------- CART KEY -------------------
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if settings.GUEST_CART_TOKENS and not request.user.is_authenticated:
+            # Also what @idempotent keys a token guest's requests on
+            request.guest_cart_key = guest_cart_key_from_request(request)
+
+    def get_cart_key(self, request, create=True):
+        """
+        Redis cart key for the caller: user:{id} when authenticated,
+        otherwise the guest token's key or the session key. With
+        create=False a guest without either gets None; otherwise a key is
+        made (a new token is sent with the response, or a session created).
+        """
+        if request.user.is_authenticated:
+            return f"user:{request.user.id}"
 
-        return Response(
-            {
-                "order_id": order.id,
-                "reference": order.reference,
-                "shipping_cost": shipping_fee,
-                "total_amount": total_amount,
-                "authorization_url": paystack_resp["data"]["authorization_url"],
-                "access_code": paystack_resp["data"]["access_code"],
-            },
-            status=200,
-        )
+        if settings.GUEST_CART_TOKENS:
+            key = getattr(request, "guest_cart_key", None)
+            if not key and create:
+                key = request.guest_cart_key = request.new_guest_cart_key = new_guest_cart_key()
+            return key
+
+        if not request.session.session_key and create:
+            request.session.create()
+        return request.session.session_key
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        key = getattr(request, "new_guest_cart_key", None)
+        # The token only goes out once its cart has actually been written
+        if key and 200 <= response.status_code < 300:
+            set_guest_cart_token(response, key)
+        return super().finalize_response(request, response, *args, **kwargs)
 
     # ------------------- LOAD CART -------------------
     def load_cart(self, request):
         if request.user.is_authenticated:
-            user_key = f"user:{request.user.id}"
-            cached_cart = redis_get_cart(user_key) or {}
-            if cached_cart:
-                return cached_cart, "redis"
+            return load_user_cart(request.user), "redis"
 
-            db_cart, _ = Cart.objects.get_or_create(user=request.user, is_active=True)
-            cart_data = {
-                str(i.product.id): {
-                    "quantity": i.quantity,
-                    "price_snapshot": float(i.price_snapshot),
-                    "subtotal": float(i.subtotal),
-                }
-                for i in db_cart.items.all()
-            }
-            save_cart(user_key, cart_data)
-            return cart_data, "redis"
-
-        session_key = request.session.session_key or request.session.create()
-        cart_data = redis_get_cart(session_key) or {}
+        session_key = self.get_cart_key(request)
+        cart_data = redis_get_cart(session_key)
         return {"session_key": session_key, "items": cart_data}, "redis"
+
+
+class MergeCartAPIView(APIView):
+    """
+    Fold the guest cart into the logged-in user's cart.
+    Call it right after login. The guest cart is taken from the guest cart
+    token (header or cookie), the session cookie, or `session_key` in the
+    body for clients that keep it.
+    """
+
+    permission_classes = [CartPermission]
+    throttle_classes = [ComboRateThrottle]
+
+    @swagger_auto_schema(
+        operation_summary="Merge guest cart",
+        operation_description=(
+            "Merge the guest cart into the authenticated user's cart. "
+            "Quantities of products in both carts are added up."
+        ),
+        responses={200: "Carts merged"},
+    )
+    @idempotent
+    @records_cart_event("merge")
+    def post(self, request):
+        guest_key = guest_cart_key_from_request(request)
+        if not guest_key:
+            guest_key = request.data.get("session_key") or request.session.session_key
+            # Only plain session keys; never another user's cart
+            if not guest_key or not str(guest_key).isalnum():
+                return Response({"error": "No guest session found"}, status=400)
+
+        user = request.user
+        # Rebuild the user's Redis cart from the DB first so nothing is lost
+        load_user_cart(user)
+        cart_data = merge_carts(user_cart_key(user.id), guest_key)
+        sync_user_cart.delay(user.id)
+
+        return Response(
+            cart_payload(cart_data),
+            status=status.HTTP_200_OK,
+            headers={"ETag": cart_etag(cart_data.version)},
+        )
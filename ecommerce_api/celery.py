@@ -7,3 +7,5 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecommerce_api.settings")
 app = Celery("ecommerce_api")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+# Task modules in this project are named celery_tasks.py
+app.autodiscover_tasks(related_name="celery_tasks")
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+import shortuuid
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _caller(request):
+    """
+    Whose key this is: keys are only unique per user (or guest cart/session).
+    """
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.id}"
+    guest_cart_key = getattr(request, "guest_cart_key", None)
+    if guest_cart_key:
+        return guest_cart_key
+    session_key = request.session.session_key
+    return f"session:{session_key}" if session_key else None
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}:{request.path}:{payload}".encode()).hexdigest()
+
+
+# Set again on every response anyway
+NOT_REPLAYED_HEADERS = {"content-type", "content-length", "vary", "allow"}
+
+
+def _stored_response(response, fingerprint):
+    """
+    What is needed to send `response` again: body, status, headers (e.g.
+    ETag, X-Cart-Token) and cookies.
+    """
+    return {
+        "fingerprint": fingerprint,
+        "status": response.status_code,
+        "content_type": response["Content-Type"],
+        "content": response.content,
+        "headers": {
+            name: value
+            for name, value in response.items()
+            if name.lower() not in NOT_REPLAYED_HEADERS
+        },
+        "cookies": {
+            name: (morsel.value, {attr: value for attr, value in morsel.items() if value})
+            for name, morsel in response.cookies.items()
+        },
+    }
+
+
+def _replay(stored):
+    response = HttpResponse(
+        stored["content"], status=stored["status"], content_type=stored["content_type"]
+    )
+    for name, value in stored.get("headers", {}).items():
+        response[name] = value
+    for name, (value, attrs) in stored.get("cookies", {}).items():
+        response.cookies[name] = value
+        response.cookies[name].update(attrs)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    Honour the Idempotency-Key header on a DRF view method.
+
+    The first response for a key (per user or guest session) is stored in the
+    cache for IDEMPOTENCY_TTL seconds once DRF has finalized and rendered it,
+    and replayed byte for byte, headers and cookies included, on every retry.
+    A retry arriving while the first request is still running waits up to
+    IDEMPOTENCY_WAIT seconds for its result. Reusing a key for a different
+    request body is rejected with 422.
+    Requests without the header, and guests without a session yet, are
+    handled normally.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        caller = _caller(request) if key else None
+        if not caller:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{IDEMPOTENCY_HEADER} is too long"}, status=400)
+
+        cache_key = f"idempotency:{caller}:{key}:{view_method.__name__}"
+        lock_key = f"{cache_key}:lock"
+        fingerprint = _fingerprint(request)
+        token = shortuuid.uuid()
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while True:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                if stored["fingerprint"] != fingerprint:
+                    return Response(
+                        {"error": f"{IDEMPOTENCY_HEADER} was already used for another request"},
+                        status=422,
+                    )
+                return _replay(stored)
+
+            if cache.add(lock_key, token, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            if time.monotonic() >= deadline:
+                return Response(
+                    {"error": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                    status=409,
+                )
+            time.sleep(0.05)
+
+        def release():
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+        def store(response):
+            try:
+                if response.status_code < 500:
+                    cache.set(
+                        cache_key,
+                        _stored_response(response, fingerprint),
+                        timeout=settings.IDEMPOTENCY_TTL,
+                    )
+            finally:
+                release()
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            release()
+            raise
+        if isinstance(response, SimpleTemplateResponse) and not response.is_rendered:
+            # Store the exact bytes sent: DRF's dispatch() finalizes the response
+            # (e.g. the guest cart token) and Django renders it after we return
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+    return wrapper
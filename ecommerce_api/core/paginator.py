@@ -0,0 +1,71 @@
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 10000
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over large tables.
+
+    COUNT(*) on a big Postgres table scans it entirely. An unfiltered list
+    uses the planner's row estimate (pg_class.reltuples) instead; a filtered
+    one counts at most EXACT_COUNT_THRESHOLD rows. When the count is such an
+    approximation, pages past it are still served as long as they hold rows
+    (they are just not linked), and a page with no rows is an EmptyPage.
+    Pair it with ModelAdmin.show_full_result_count = False.
+    """
+
+    count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is None:
+            return super().count
+
+        if not query.where:
+            estimate = self._estimated_rows(queryset)
+            if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+                self.count_is_approximate = True
+                return estimate
+        count = queryset[: EXACT_COUNT_THRESHOLD + 1].count()
+        self.count_is_approximate = count > EXACT_COUNT_THRESHOLD
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Past an approximate count: page() finds out whether rows are left
+            if self.count_is_approximate and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super().page(number)
+        # The count is not exact, so the slice is not clamped to it; the page
+        # query itself tells whether the page exists
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom : bottom + self.per_page])
+        if not object_list and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return self._get_page(object_list, number, self)
+
+    def _estimated_rows(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 until the table has been analyzed
+        return row[0] if row and row[0] >= 0 else None
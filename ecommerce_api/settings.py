@@ -15,7 +15,7 @@ from datetime import timedelta
 from pathlib import Path
 
 import shippo
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -111,19 +111,133 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default="webmaster@example.com")
 
+REDIS_URL = config("REDIS_URL")
+REDIS_MAX_CONNECTIONS = config("REDIS_MAX_CONNECTIONS", cast=int, default=50)
+REDIS_SOCKET_TIMEOUT = config("REDIS_SOCKET_TIMEOUT", cast=float, default=1.0)
+REDIS_SOCKET_CONNECT_TIMEOUT = config("REDIS_SOCKET_CONNECT_TIMEOUT", cast=float, default=1.0)
+REDIS_HEALTH_CHECK_INTERVAL = config("REDIS_HEALTH_CHECK_INTERVAL", cast=int, default=30)
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": config("REDIS_URL"),
+        "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_TIMEOUT": REDIS_SOCKET_TIMEOUT,
+            "SOCKET_CONNECT_TIMEOUT": REDIS_SOCKET_CONNECT_TIMEOUT,
+            "CONNECTION_POOL_KWARGS": {
+                "max_connections": REDIS_MAX_CONNECTIONS,
+                "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+            },
         },
     }
 }
 
+# Redis cart store (carts/redis_cart.py, carts/redis_client.py)
+# The client is created lazily per process. Set CART_REDIS_USE_CACHE_POOL to
+# take the server and pool settings of the django-redis cache above instead of
+# CART_REDIS_URL and the options below. The connections themselves cannot be
+# shared: the cart code needs str replies (decode_responses=True), which would
+# break the cache, so the cart client always gets a decoding pool of its own.
+# CART_REDIS_MODE: "single" (default), "cluster" (Redis Cluster, any node in
+# CART_REDIS_URL) or "sharded" (client-side sharding over CART_REDIS_SHARDS,
+# a comma separated list of URLs).
+CART_REDIS = {
+    "MODE": config("CART_REDIS_MODE", default="single"),
+    "URL": config("CART_REDIS_URL", default="") or REDIS_URL,
+    "SHARDS": config("CART_REDIS_SHARDS", cast=Csv(), default=""),
+    "MAX_CONNECTIONS": config("CART_REDIS_MAX_CONNECTIONS", cast=int, default=REDIS_MAX_CONNECTIONS),
+    "SOCKET_TIMEOUT": config("CART_REDIS_SOCKET_TIMEOUT", cast=float, default=REDIS_SOCKET_TIMEOUT),
+    "SOCKET_CONNECT_TIMEOUT": config(
+        "CART_REDIS_SOCKET_CONNECT_TIMEOUT", cast=float, default=REDIS_SOCKET_CONNECT_TIMEOUT
+    ),
+    "HEALTH_CHECK_INTERVAL": config(
+        "CART_REDIS_HEALTH_CHECK_INTERVAL", cast=int, default=REDIS_HEALTH_CHECK_INTERVAL
+    ),
+    "USE_CACHE_POOL": config("CART_REDIS_USE_CACHE_POOL", cast=bool, default=False),
+    "CACHE_ALIAS": "default",
+}
+
+# Write-behind: when enabled, authenticated cart changes only go to Redis and
+# carts.celery_tasks.flush_dirty_carts writes them to Postgres in batches
+# every CART_FLUSH_INTERVAL seconds. Checkout always flushes first.
+CART_WRITE_BEHIND = config("CART_WRITE_BEHIND", cast=bool, default=False)
+CART_FLUSH_INTERVAL = config("CART_FLUSH_INTERVAL", cast=float, default=30.0)
+CART_FLUSH_BATCH_SIZE = config("CART_FLUSH_BATCH_SIZE", cast=int, default=200)
+
+# Cart sweeper (carts.celery_tasks.sweep_carts): SCANs the Redis carts, purges
+# inactive DB carts older than CART_INACTIVE_RETENTION_DAYS in small delete
+# batches and logs abandoned-cart metrics.
+CART_SWEEP_INTERVAL = config("CART_SWEEP_INTERVAL", cast=float, default=3600.0)
+CART_SWEEP_MAX_KEYS = config("CART_SWEEP_MAX_KEYS", cast=int, default=50000)
+CART_SWEEP_SCAN_COUNT = config("CART_SWEEP_SCAN_COUNT", cast=int, default=1000)
+CART_SWEEP_BATCH_SIZE = config("CART_SWEEP_BATCH_SIZE", cast=int, default=500)
+CART_SWEEP_DELETE_BATCH_SIZE = config("CART_SWEEP_DELETE_BATCH_SIZE", cast=int, default=200)
+CART_INACTIVE_RETENTION_DAYS = config("CART_INACTIVE_RETENTION_DAYS", cast=int, default=30)
+CART_ABANDONED_AFTER_HOURS = config("CART_ABANDONED_AFTER_HOURS", cast=int, default=24)
+
+# Guest carts (carts/guest_tokens.py): with GUEST_CART_TOKENS on, anonymous
+# carts are identified by a signed token (X-Cart-Token header or cookie)
+# issued on the first write, instead of a Django session.
+GUEST_CART_TOKENS = config("GUEST_CART_TOKENS", cast=bool, default=False)
+GUEST_CART_COOKIE_NAME = "cart_token"
+GUEST_CART_COOKIE_AGE = config("GUEST_CART_COOKIE_AGE", cast=int, default=1209600)
+
+# Repricing: a product price change reprices the carts holding it (found via
+# a Redis reverse index), CART_REPRICE_BATCH_SIZE carts per pipelined batch.
+CART_REPRICE_BATCH_SIZE = config("CART_REPRICE_BATCH_SIZE", cast=int, default=500)
+
+# Cart activity stream (carts/cart_events.py): one XADD per cart action,
+# capped at about CART_EVENTS_MAXLEN entries, rolled up into hourly rows
+# every CART_EVENTS_ROLLUP_INTERVAL seconds.
+CART_EVENTS_ENABLED = config("CART_EVENTS_ENABLED", cast=bool, default=True)
+CART_EVENTS_MAXLEN = config("CART_EVENTS_MAXLEN", cast=int, default=1000000)
+CART_EVENTS_BATCH_SIZE = config("CART_EVENTS_BATCH_SIZE", cast=int, default=1000)
+CART_EVENTS_ROLLUP_INTERVAL = config("CART_EVENTS_ROLLUP_INTERVAL", cast=float, default=60.0)
+
+# Product summaries embedded in cart responses (?expand=product), cached per
+# product and dropped whenever the product is saved.
+PRODUCT_SUMMARY_TTL = config("PRODUCT_SUMMARY_TTL", cast=int, default=300)
+
+# Idempotency-Key support (ecommerce_api/core/idempotency.py): first responses
+# are kept IDEMPOTENCY_TTL seconds; a concurrent retry waits IDEMPOTENCY_WAIT
+# seconds for the in-flight request, whose lock expires after
+# IDEMPOTENCY_LOCK_TIMEOUT seconds.
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", cast=int, default=86400)
+IDEMPOTENCY_WAIT = config("IDEMPOTENCY_WAIT", cast=float, default=10.0)
+IDEMPOTENCY_LOCK_TIMEOUT = config("IDEMPOTENCY_LOCK_TIMEOUT", cast=int, default=60)
+
+# Stock reservations (carts/stock_reservations.py): checkout holds stock in
+# Redis for STOCK_RESERVATION_TTL seconds while payment is pending.
+STOCK_RESERVATION_TTL = config("STOCK_RESERVATION_TTL", cast=int, default=900)
+STOCK_RELEASE_INTERVAL = config("STOCK_RELEASE_INTERVAL", cast=float, default=60.0)
+STOCK_RECONCILE_INTERVAL = config("STOCK_RECONCILE_INTERVAL", cast=float, default=300.0)
+
 # Paystack API Keys
 PAYSTACK_PUBLIC_KEY = config("PAYSTACK_PUBLIC_KEY")
 PAYSTACK_SECRET_KEY = config("PAYSTACK_SECRET_KEY")
+# Answer Paystack calls locally (orders/paystack_stub.py) for offline testing;
+# its checkout URLs are not served, pay by posting a webhook event instead
+PAYSTACK_STUB = config("PAYSTACK_STUB", cast=bool, default=False)
+PAYSTACK_STUB_DELAY = config("PAYSTACK_STUB_DELAY", cast=float, default=0.0)
+# Initialize payment in a Celery task: checkout answers 202 and the client
+# polls orders/<id>/payment/ for the authorization URL
+PAYMENT_INIT_ASYNC = config("PAYMENT_INIT_ASYNC", cast=bool, default=False)
+
+# Paystack webhook inbox (orders/payment_events.py): events are stored and
+# acknowledged at once, then applied in batches by a worker kicked on every
+# new event and, as a safety net, every PAYMENT_EVENTS_INTERVAL seconds.
+PAYMENT_EVENTS_BATCH_SIZE = config("PAYMENT_EVENTS_BATCH_SIZE", cast=int, default=100)
+PAYMENT_EVENTS_INTERVAL = config("PAYMENT_EVENTS_INTERVAL", cast=float, default=30.0)
+
+# Outbox (orders/outbox.py): side effects of order processing are relayed
+# right after commit; what fails is retried every OUTBOX_RELAY_INTERVAL seconds.
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", cast=int, default=100)
+OUTBOX_RELAY_INTERVAL = config("OUTBOX_RELAY_INTERVAL", cast=float, default=60.0)
+
+# Order history pages with a cursor instead of page numbers: no COUNT(*), no
+# OFFSET, constant time at any depth (orders/pagination.py).
+ORDER_CURSOR_PAGINATION = config("ORDER_CURSOR_PAGINATION", cast=bool, default=False)
 
 
 # Shippo API Key
@@ -136,6 +250,36 @@ SESSION_CACHE_ALIAS = "default"
 
 CELERY_BROKER_URL = config("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = config("CELERY_RESULT_BACKEND")
+CELERY_BEAT_SCHEDULE = {
+    "flush-dirty-carts": {
+        "task": "carts.celery_tasks.flush_dirty_carts",
+        "schedule": CART_FLUSH_INTERVAL,
+    },
+    "sweep-carts": {
+        "task": "carts.celery_tasks.sweep_carts",
+        "schedule": CART_SWEEP_INTERVAL,
+    },
+    "release-expired-stock": {
+        "task": "carts.celery_tasks.release_expired_stock",
+        "schedule": STOCK_RELEASE_INTERVAL,
+    },
+    "reconcile-stock": {
+        "task": "carts.celery_tasks.reconcile_stock_counters",
+        "schedule": STOCK_RECONCILE_INTERVAL,
+    },
+    "roll-up-cart-events": {
+        "task": "carts.celery_tasks.roll_up_cart_events_task",
+        "schedule": CART_EVENTS_ROLLUP_INTERVAL,
+    },
+    "process-payment-events": {
+        "task": "orders.celery_tasks.process_payment_events",
+        "schedule": PAYMENT_EVENTS_INTERVAL,
+    },
+    "relay-outbox": {
+        "task": "orders.celery_tasks.relay_outbox",
+        "schedule": OUTBOX_RELAY_INTERVAL,
+    },
+}
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
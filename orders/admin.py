@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.utils import timezone
 
-from .models import Order, OrderItem
+from .models import Order, OrderItem, OutboxMessage, PaymentEvent
 
 
 class OrderItemInline(admin.TabularInline):
@@ -108,4 +109,51 @@ class OrderAdmin(admin.ModelAdmin):
         return self.readonly_fields
 
 
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "event", "reference", "status", "attempts", "received_at")
+    list_filter = ("status", "event", "received_at")
+    search_fields = ("event_id", "reference")
+    readonly_fields = (
+        "event_id",
+        "event",
+        "reference",
+        "payload",
+        "attempts",
+        "last_error",
+        "received_at",
+        "processed_at",
+    )
+    actions = ["replay_events"]
+
+    @admin.action(description="Replay selected events")
+    def replay_events(self, request, queryset):
+        # Applying an event twice is harmless: paid orders are skipped
+        replayed = queryset.update(status="pending", attempts=0, last_error="")
+        self.message_user(request, f"{replayed} events queued for replay.")
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "available_at", "created_at")
+    list_filter = ("status", "kind")
+    readonly_fields = (
+        "kind",
+        "payload",
+        "attempts",
+        "last_error",
+        "available_at",
+        "created_at",
+        "sent_at",
+    )
+    actions = ["retry_messages"]
+
+    @admin.action(description="Retry selected messages")
+    def retry_messages(self, request, queryset):
+        retried = queryset.exclude(status="sent").update(
+            status="pending", attempts=0, available_at=timezone.now()
+        )
+        self.message_user(request, f"{retried} messages queued for retry.")
+
+
 # Register your models here.
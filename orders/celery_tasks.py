@@ -0,0 +1,75 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from carts.stock_reservations import release_stock
+
+from .models import Order
+from .outbox import relay_outbox as relay_outbox_messages
+from .payment_events import drain_payment_events
+from .utils import initialize_transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _fail_payment_init(order, message):
+    order.payment_status = "failed"
+    order.save(update_fields=["payment_status"])
+    release_stock(order.id)
+    logger.error(f"Payment initialization for order {order.id} failed: {message}")
+
+
+@shared_task(bind=True, max_retries=3)
+def initialize_order_payment(self, order_id):
+    """
+    Initialize the Paystack transaction of a new order (async checkout).
+    The client polls orders/<id>/payment/ until the authorization URL is set.
+    """
+    order = Order.objects.select_related("user").filter(id=order_id).first()
+    if not order:
+        logger.error(f"Order {order_id} not found.")
+        return
+
+    if order.payment_authorization_url or order.payment_status != "pending":
+        return
+
+    try:
+        paystack_resp = initialize_transaction(
+            order.user.email, int(order.total), order.reference
+        )
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            _fail_payment_init(order, exc)
+            return
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+
+    if not paystack_resp.get("status"):
+        _fail_payment_init(order, paystack_resp.get("message", "Payment failed"))
+        return
+
+    order.payment_authorization_url = paystack_resp["data"]["authorization_url"]
+    order.payment_access_code = paystack_resp["data"]["access_code"]
+    order.save(update_fields=["payment_authorization_url", "payment_access_code"])
+
+
+@shared_task
+def process_payment_events():
+    """
+    Apply the Paystack webhook events waiting in the inbox.
+    """
+    handled = drain_payment_events(batch_size=settings.PAYMENT_EVENTS_BATCH_SIZE)
+    if handled:
+        logger.info(f"Handled {handled} payment events.")
+    return handled
+
+
+@shared_task
+def relay_outbox():
+    """
+    Retry outbox messages that were not sent right after their commit.
+    """
+    sent = relay_outbox_messages(batch_size=settings.OUTBOX_BATCH_SIZE)
+    if sent:
+        logger.info(f"Relayed {sent} outbox messages.")
+    return sent
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:45
+
+import shortuuid.main
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_alter_order_id_alter_orderitem_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_access_code',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_authorization_url',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='id',
+            field=models.CharField(default=shortuuid.main.ShortUUID.uuid, editable=False, max_length=22, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import shortuuid
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 from carts.models import Cart
 from product.models import Product
@@ -62,6 +63,8 @@ class Order(models.Model):
         max_length=100, null=True, blank=True, unique=True
     )
     payment_method = models.CharField(max_length=50, null=True, blank=True)
+    payment_authorization_url = models.CharField(max_length=255, null=True, blank=True)
+    payment_access_code = models.CharField(max_length=100, null=True, blank=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     currency = models.CharField(
         max_length=3, default="NGN", help_text="Currency code, e.g., NGN, USD"
@@ -123,6 +126,8 @@ class Order(models.Model):
             models.Index(fields=["payment_status"]),
             models.Index(fields=["shipping_status"]),
             models.Index(fields=["created_at"]),
+            # A user's order history, newest first (see OrderCursorPagination)
+            models.Index(fields=["user", "-created_at"]),
             models.Index(fields=["reference"]),
         ]
 
@@ -155,4 +160,86 @@ class OrderItem(models.Model):
         verbose_name_plural = "Order Items"
 
 
-# Create your models here.
+class PaymentEvent(models.Model):
+    """
+    Inbox of Paystack webhook events. The webhook only stores the raw event
+    (deduplicated by event_id) and replies; orders.payment_events applies
+    pending events in batches. Rows are kept for replay and auditing.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.CharField(
+        primary_key=True,
+        max_length=22,
+        default=shortuuid.uuid,
+        editable=False,
+        unique=True,
+    )
+    event_id = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=100)
+    reference = models.CharField(max_length=50, blank=True, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event} {self.reference} ({self.status})"
+
+    class Meta:
+        ordering = ["-received_at"]
+        verbose_name = "Payment Event"
+        verbose_name_plural = "Payment Events"
+        indexes = [
+            # The worker's queue: pending events, oldest first
+            models.Index(fields=["status", "received_at"]),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """
+    A side effect (email, stock commit, ...) recorded in the same
+    transaction as the change that causes it, and carried out by
+    orders.outbox after that transaction commits, with retries.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.CharField(
+        primary_key=True,
+        max_length=22,
+        default=shortuuid.uuid,
+        editable=False,
+        unique=True,
+    )
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+        indexes = [
+            # The relay's queue: pending messages that are due
+            models.Index(fields=["status", "available_at"]),
+        ]
@@ -0,0 +1,109 @@
+"""
+Transactional outbox for side effects of order processing.
+
+publish() stores the messages in the caller's transaction, so they exist
+if and only if it commits, and hands them to relay_outbox() right after
+the commit. No row lock is held while an email goes out. Messages that
+fail are retried with backoff, both by later relays and by the
+orders.celery_tasks.relay_outbox beat task. Handlers must tolerate running
+twice: a crash after a send but before its row is marked sent repeats it.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+
+from carts.stock_reservations import commit_stock
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# After this many failed attempts a message is marked failed
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 30  # seconds, doubled after every attempt
+
+FROM_EMAIL = "no-reply@shop.com"
+
+
+def _send_mail(payload):
+    send_mail(
+        subject=payload["subject"],
+        message=payload["message"],
+        from_email=FROM_EMAIL,
+        recipient_list=payload["recipient_list"],
+        fail_silently=False,
+    )
+
+
+HANDLERS = {
+    "commit_stock": lambda payload: commit_stock(payload["hold_id"]),
+    "send_mail": _send_mail,
+}
+
+
+# -------------------- PUBLISH --------------------
+def publish(messages):
+    """
+    Record [(kind, payload), ...] in the current transaction (one bulk
+    INSERT) and relay them once it commits.
+    """
+    rows = OutboxMessage.objects.bulk_create(
+        [OutboxMessage(kind=kind, payload=payload) for kind, payload in messages]
+    )
+    ids = [row.id for row in rows]
+    transaction.on_commit(lambda: relay_outbox(ids=ids), robust=True)
+    return rows
+
+
+# -------------------- RELAY --------------------
+def _handle(message, now):
+    message.attempts += 1
+    try:
+        HANDLERS[message.kind](message.payload)
+    except Exception as exc:
+        logger.error(f"Outbox message {message.id} ({message.kind}) failed: {exc}")
+        message.last_error = str(exc)
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = "failed"
+        else:
+            delay = RETRY_BASE_DELAY * 2 ** (message.attempts - 1)
+            message.available_at = now + timedelta(seconds=delay)
+        return
+    message.status = "sent"
+    message.last_error = ""
+    message.sent_at = timezone.now()
+
+
+def relay_outbox(ids=None, batch_size=100, max_batches=10):
+    """
+    Carry out pending messages that are due (only `ids`, if given), oldest
+    first. Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+    relays never run the same message concurrently, and their outcome is
+    saved with one bulk_update. Returns the number of messages sent.
+    """
+    sent = 0
+    for _ in range(max_batches):
+        now = timezone.now()
+        with transaction.atomic():
+            queryset = OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+                status="pending", available_at__lte=now
+            )
+            if ids is not None:
+                queryset = queryset.filter(id__in=ids)
+            messages = list(queryset.order_by("available_at")[:batch_size])
+            if not messages:
+                break
+
+            for message in messages:
+                _handle(message, now)
+            OutboxMessage.objects.bulk_update(
+                messages, ["status", "attempts", "last_error", "available_at", "sent_at"]
+            )
+        sent += sum(message.status == "sent" for message in messages)
+        if len(messages) < batch_size:
+            break
+    return sent
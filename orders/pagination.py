@@ -1,7 +1,67 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class OrderPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination for order history (settings.ORDER_CURSOR_PAGINATION).
+    No COUNT(*) and no OFFSET scan: every page is one range read on the
+    created_at index, however deep. Responses carry next/previous links only.
+
+    DRF keys cursors on the first ordering field alone and falls back to
+    offsets for ties, which breaks the previous link when many orders share
+    a created_at. Here the position is the (created_at, id) pair, so it is
+    unique and no offset is ever needed.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f"{instance.created_at.isoformat()}|{instance.id}"
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        # Keep it from DRF's created_at-only filter; see paginate_queryset()
+        return cursor._replace(position=None)
+
+    def keyset_filter(self, position, reverse):
+        created_at, _, order_id = position.partition("|")
+        try:
+            created_at = parse_datetime(created_at)
+        except ValueError:
+            created_at = None
+        if created_at is None or not order_id:
+            raise NotFound(self.invalid_cursor_message)
+        op = "gt" if reverse else "lt"
+        return Q(**{f"created_at__{op}": created_at}) | Q(
+            created_at=created_at, **{f"id__{op}": order_id}
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = super().decode_cursor(request)
+        position = cursor.position if cursor else None
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, cursor.reverse))
+
+        page = super().paginate_queryset(queryset, request, view)
+        if position is not None:
+            # What DRF sets when it has applied a position itself
+            if cursor.reverse:
+                self.has_next, self.next_position = True, position
+            else:
+                self.has_previous, self.previous_position = True, position
+            self.display_page_controls = self.template is not None
+        return page
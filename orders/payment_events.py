@@ -0,0 +1,162 @@
+"""
+Paystack webhook inbox.
+
+PaymentWebhookAPIView verifies the signature and stores each event once
+(record_payment_event) before replying, so a slow database never makes
+Paystack time out and retry. drain_payment_events(), run by a Celery task
+kicked after every new event and by beat as a safety net, applies pending
+events to their orders in batches.
+"""
+
+import hashlib
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from carts.celery_tasks import process_order_after_payment
+from carts.stock_reservations import release_stock
+from services.models import Shipment
+
+from .models import Order, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# After this many failed attempts an event is marked failed and left for replay
+MAX_ATTEMPTS = 5
+
+
+def payment_event_id(payload, body):
+    """
+    Paystack sends the same event again on retries: key it on the event
+    name and transaction id, or on the raw body if there is no id.
+    """
+    transaction_id = (payload.get("data") or {}).get("id")
+    if transaction_id:
+        return f"{payload.get('event')}:{transaction_id}"
+    return hashlib.sha256(body).hexdigest()
+
+
+def record_payment_event(payload, body):
+    """
+    Store the event unless it was already received (one INSERT, or one
+    SELECT for a duplicate). Returns (event, created).
+    """
+    data = payload.get("data") or {}
+    return PaymentEvent.objects.get_or_create(
+        event_id=payment_event_id(payload, body),
+        defaults={
+            "event": payload.get("event") or "",
+            "reference": str(data.get("reference") or "")[:50],
+            "payload": payload,
+        },
+    )
+
+
+# -------------------- APPLY --------------------
+def apply_payment_event(payload):
+    """
+    Apply one event to its order under a row lock. Returns what happened.
+    """
+    reference = (payload.get("data") or {}).get("reference") or ""
+    order_id = reference.replace("ORD-", "")
+
+    with transaction.atomic():
+        order = (
+            Order.objects.select_for_update(of=("self",))
+            .select_related("user")
+            .filter(id=order_id)
+            .first()
+        )
+        if not order:
+            return "order not found"
+
+        if order.payment_status == "paid":
+            return "order already paid"
+
+        if payload.get("event") == "charge.failed":
+            # Give the stock held at checkout back right away
+            order.payment_status = "failed"
+            order.save(update_fields=["payment_status"])
+            transaction.on_commit(lambda: release_stock(order.id))
+            return "payment failure recorded"
+
+        if payload.get("event") != "charge.success":
+            return "ignored"
+
+        # Mark order as paid
+        order.payment_status = "paid"
+        order.save(update_fields=["payment_status"])
+
+        # Create shipment snapshot (if missing)
+        if not hasattr(order, "order_shipment"):
+            Shipment.objects.create(
+                order=order,
+                shipping_full_name=order.shipping_full_name,
+                shipping_address_text=order.shipping_address_text,
+                shipping_city=order.shipping_city,
+                shipping_state=order.shipping_state,
+                shipping_country=order.shipping_country,
+                shipping_postal_code=order.shipping_postal_code,
+                shipping_phone=order.shipping_phone,
+                shipping_fee=order.shipping_cost,
+                delivery_status="pending",
+            )
+
+        #  Trigger Celery task (once), after the order is committed as paid
+        user = order.user
+        transaction.on_commit(
+            lambda: process_order_after_payment.delay(
+                order_id=order.id,
+                user_email=user.email if user else None,
+                user_id=user.id if user else None,
+            )
+        )
+        return "order paid"
+
+
+# -------------------- DRAIN --------------------
+def drain_payment_events(batch_size=100, max_batches=10):
+    """
+    Apply up to max_batches * batch_size pending events, oldest first.
+    Each batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+    workers can drain side by side, and its outcome is saved with one
+    bulk_update. A failing event only rolls back its own savepoint.
+    Returns the number of events handled.
+    """
+    handled = 0
+    retry_later = []  # failed in this run; not claimed again until the next one
+    for _ in range(max_batches):
+        with transaction.atomic():
+            events = list(
+                PaymentEvent.objects.select_for_update(skip_locked=True)
+                .filter(status="pending")
+                .exclude(id__in=retry_later)
+                .order_by("received_at")[:batch_size]
+            )
+            if not events:
+                break
+
+            for event in events:
+                event.attempts += 1
+                try:
+                    outcome = apply_payment_event(event.payload)
+                except Exception as exc:
+                    logger.error(f"Payment event {event.event_id} failed: {exc}")
+                    event.last_error = str(exc)
+                    if event.attempts >= MAX_ATTEMPTS:
+                        event.status = "failed"
+                    retry_later.append(event.id)
+                    continue
+                logger.info(f"Payment event {event.event_id}: {outcome}")
+                event.status = "processed"
+                event.last_error = ""
+                event.processed_at = timezone.now()
+
+            PaymentEvent.objects.bulk_update(
+                events, ["status", "attempts", "last_error", "processed_at"]
+            )
+        handled += len(events)
+        if len(events) < batch_size:
+            break
+    return handled
@@ -0,0 +1,50 @@
+"""
+Offline stand-in for the Paystack transaction API.
+
+Enabled with PAYSTACK_STUB=True; orders.utils then answers from here instead
+of calling Paystack, so checkout and payment can be exercised without
+network access or real keys. Responses follow the shape of the real API.
+PAYSTACK_STUB_DELAY adds latency to mimic a slow gateway.
+
+The authorization URLs it hands out are inert: the .invalid domain never
+resolves and nothing serves a checkout page. To complete a stub payment,
+post a charge.success event for the order's reference to the Paystack
+webhook instead.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+
+STUB_CHECKOUT_URL = "https://checkout.paystack-stub.invalid/"
+
+
+def _access_code(reference):
+    return hashlib.sha256(reference.encode()).hexdigest()[:15]
+
+
+def initialize_transaction(email, amount, reference, currency="NGN"):
+    time.sleep(settings.PAYSTACK_STUB_DELAY)
+    if not email or amount <= 0:
+        return {"status": False, "message": "Invalid transaction data"}
+
+    access_code = _access_code(reference)
+    return {
+        "status": True,
+        "message": "Authorization URL created",
+        "data": {
+            "authorization_url": f"{STUB_CHECKOUT_URL}{access_code}",
+            "access_code": access_code,
+            "reference": reference,
+        },
+    }
+
+
+def verify_transaction(reference):
+    time.sleep(settings.PAYSTACK_STUB_DELAY)
+    return {
+        "status": True,
+        "message": "Verification successful",
+        "data": {"status": "success", "reference": reference},
+    }
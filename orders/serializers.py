@@ -1,12 +1,36 @@
 from rest_framework import serializers
 
+from product.models import Product
 from product.serializers import ProductSerializer
 
 from .models import Order, OrderItem
 
 
+class OrderProductSerializer(serializers.ModelSerializer):
+    """
+    Just enough of the product to show an order line.
+    """
+
+    class Meta:
+        model = Product
+        fields = ["id", "name", "image"]
+
+
+class ExpandedProductSerializer(ProductSerializer):
+    """
+    The full product, for ?expand=items.product. The rating is computed from
+    the prefetched reviews instead of one AVG query per product.
+    """
+
+    average_rating = serializers.SerializerMethodField()
+
+    def get_average_rating(self, obj):
+        ratings = [review.rating for review in obj.reviews.all()]
+        return round(sum(ratings) / len(ratings), 1) if ratings else 0.0
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_detail = ProductSerializer(source="product", read_only=True)
+    product_detail = OrderProductSerializer(source="product", read_only=True)
     subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
@@ -21,6 +45,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         ]
 
 
+class ExpandedOrderItemSerializer(OrderItemSerializer):
+    product_detail = ExpandedProductSerializer(source="product", read_only=True)
+
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     shipment_created = serializers.BooleanField(read_only=True)
@@ -76,3 +104,7 @@ class OrderSerializer(serializers.ModelSerializer):
             "country": obj.shipping_country,
             "postal_code": obj.shipping_postal_code,
         }
+
+
+class ExpandedOrderSerializer(OrderSerializer):
+    items = ExpandedOrderItemSerializer(many=True, read_only=True)
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from product.models import Category, Product
+from users.models import User
+
+from .models import Order, OrderItem, OutboxMessage, PaymentEvent
+from .outbox import publish, relay_outbox
+from .payment_events import drain_payment_events
+
+WEBHOOK_URL = "/api/orders/paystack/webhook/"
+LIST_URL = "/api/orders/list/"
+
+
+class OrderTestCase(TestCase):
+    """
+    A user with one pending order.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com",
+            password="pw",
+            username="buyer",
+            phone_number="+2348030000001",
+        )
+        self.order = Order.objects.create(
+            user=self.user, total=Decimal("21.00"), shipping_cost=Decimal("5.00")
+        )
+        self.order.reference = f"ORD-{self.order.id}"
+        self.order.save(update_fields=["reference"])
+
+
+class PaymentWebhookTests(OrderTestCase):
+    def post_event(self, event, transaction_id=1):
+        body = json.dumps(
+            {"event": event, "data": {"id": transaction_id, "reference": self.order.reference}}
+        ).encode()
+        signature = hmac.new(
+            settings.PAYSTACK_SECRET_KEY.encode(), msg=body, digestmod=hashlib.sha512
+        ).hexdigest()
+        with mock.patch("orders.views.process_payment_events") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = APIClient().post(
+                    WEBHOOK_URL,
+                    data=body,
+                    content_type="application/json",
+                    HTTP_X_PAYSTACK_SIGNATURE=signature,
+                )
+        return response, task.delay.call_count
+
+    def drain(self):
+        with mock.patch("orders.payment_events.process_order_after_payment") as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                handled = drain_payment_events()
+        return handled, task.delay.call_count
+
+    def test_duplicate_charge_success_is_processed_once(self):
+        response, kicked = self.post_event("charge.success")
+        self.assertEqual(response.json(), {"message": "Event received"})
+        self.assertEqual(kicked, 1)
+
+        response, kicked = self.post_event("charge.success")
+        self.assertEqual(response.json(), {"message": "Event already received"})
+        self.assertEqual(kicked, 0)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+        self.assertEqual(self.drain(), (1, 1))
+        self.assertEqual(self.drain(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "paid")
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ("processed", 1))
+
+    def test_unsigned_event_is_rejected(self):
+        response = APIClient().post(WEBHOOK_URL, data={"event": "charge.success"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+
+class OrderListTestCase(OrderTestCase):
+    """
+    Two products and an authenticated API client for the order list.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Books")
+        self.products = [
+            Product.objects.create(
+                owner=self.user, category=category, name=name, price=Decimal("10.50"), stock=5
+            )
+            for name in ("P1", "P2")
+        ]
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, total=Decimal("21.00"), shipping_cost=Decimal("5.00")
+            )
+            for product in self.products:
+                OrderItem.objects.create(order=order, product=product, price_snapshot=product.price)
+
+
+class OrderExpandTests(OrderListTestCase):
+    def test_expand_query_counts_do_not_grow_with_orders(self):
+        # COUNT, orders, items, products; expanding adds the reviews
+        for orders in (2, 5):
+            self.add_orders(orders)
+            with self.assertNumQueries(4):
+                compact = self.client.get(LIST_URL).json()["results"]
+            with self.assertNumQueries(5):
+                expanded = self.client.get(LIST_URL + "?expand=items.product").json()["results"]
+
+        line = compact[0]["items"][0]["product_detail"]
+        self.assertEqual(set(line), {"id", "name", "image"})
+        line = expanded[0]["items"][0]["product_detail"]
+        self.assertEqual(line["category"]["name"], "Books")
+        self.assertEqual(line["average_rating"], 0)
+
+
+class OrderCursorPaginationTests(OrderListTestCase):
+    @override_settings(ORDER_CURSOR_PAGINATION=True)
+    def test_cursor_walks_every_order_once_without_count(self):
+        self.add_orders(8)
+        # Ties on created_at are broken by id
+        Order.objects.update(created_at=timezone.now())
+
+        seen, url = [], LIST_URL + "?page_size=4"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url).json()
+            self.assertFalse([q for q in queries if "COUNT(" in q["sql"]])
+            self.assertNotIn("count", page)
+            seen += [order["id"] for order in page["results"]]
+            url = page["next"]
+
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(set(seen), set(Order.objects.values_list("id", flat=True)))
+        previous = self.client.get(page["previous"]).json()["results"]
+        self.assertEqual([order["id"] for order in previous], seen[4:8])
+
+
+class OutboxTests(TestCase):
+    def test_failed_send_is_retried_until_sent(self):
+        mail = {"subject": "Order paid", "message": "Thanks", "recipient_list": ["a@b.c"]}
+        with mock.patch(
+            "orders.outbox.send_mail", side_effect=[ConnectionError("SMTP down"), 1]
+        ) as send_mail:
+            with self.captureOnCommitCallbacks(execute=True):
+                [message] = publish([("send_mail", mail)])
+
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ("pending", 1))
+            self.assertEqual(message.last_error, "SMTP down")
+            self.assertGreater(message.available_at, timezone.now())
+
+            # Not due yet; then the backoff has passed
+            self.assertEqual(relay_outbox(), 0)
+            OutboxMessage.objects.update(available_at=timezone.now())
+            self.assertEqual(relay_outbox(), 1)
+
+        self.assertEqual(send_mail.call_count, 2)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("sent", 2))
+        self.assertEqual(message.last_error, "")
+        self.assertIsNotNone(message.sent_at)
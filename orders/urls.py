@@ -1,6 +1,11 @@
 from django.urls import path
 
-from .views import OrderDetailAPIView, OrderListAPIView, PaymentWebhookAPIView
+from .views import (
+    OrderDetailAPIView,
+    OrderListAPIView,
+    OrderPaymentStatusAPIView,
+    PaymentWebhookAPIView,
+)
 
 urlpatterns = [
     path("orders/list/", OrderListAPIView.as_view(), name="order-list"),
@@ -9,6 +14,11 @@ urlpatterns = [
         OrderDetailAPIView.as_view(),
         name="order-detail",
     ),
+    path(
+        "orders/<str:order_id>/payment/",
+        OrderPaymentStatusAPIView.as_view(),
+        name="order-payment",
+    ),
     path(
         "orders/paystack/webhook/",
         PaymentWebhookAPIView.as_view(),
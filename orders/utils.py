@@ -1,6 +1,8 @@
 from django.conf import settings
 from paystackapi.paystack import Paystack
 
+from . import paystack_stub
+
 paystack = Paystack(secret_key=settings.PAYSTACK_SECRET_KEY)
 
 
@@ -16,6 +18,11 @@ def initialize_transaction(email, amount, reference, currency="NGN"):
     else:
         paystack_amount = float(amount)  # USD, GHS, ZAR → NO conversion
 
+    if settings.PAYSTACK_STUB:
+        return paystack_stub.initialize_transaction(
+            email, paystack_amount, reference, currency.upper()
+        )
+
     response = paystack.transaction.initialize(
         email=email,
         amount=paystack_amount,
@@ -29,4 +36,6 @@ def verify_transaction(reference):
     """
     Verify Paystack transaction by its reference.
     """
+    if settings.PAYSTACK_STUB:
+        return paystack_stub.verify_transaction(reference)
     return paystack.transaction.verify(reference)
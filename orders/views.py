@@ -4,6 +4,7 @@ import json
 
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import permissions, status
@@ -11,14 +12,42 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.throttling import ScopedRateThrottle
 
-from carts.celery_tasks import process_order_after_payment
-from services.models import Shipment
+from product.models import Product
+from reviews.models import Review
+from .celery_tasks import process_payment_events
 from .models import Order
-from .pagination import OrderPagination
+from .pagination import OrderCursorPagination, OrderPagination
+from .payment_events import record_payment_event
 from .permissions import IsOwnerOrAdmin
-from .serializers import OrderSerializer
+from .serializers import ExpandedOrderSerializer, OrderSerializer
 from ecommerce_api.core.throttles import ComboRateThrottle  
 
+EXPAND_PRODUCTS = "items.product"
+
+
+def expands_products(request):
+    return EXPAND_PRODUCTS in request.query_params.get("expand", "").split(",")
+
+
+def orders_with_items(expand=False):
+    """
+    Orders with their items and products, in a fixed number of queries
+    however many orders are serialized. Compact lines only load the product's
+    id, name and image; ?expand=items.product also loads its category and
+    owner (joined) and its reviews with their authors (one more query).
+    """
+    if expand:
+        products = Product.objects.select_related("category", "owner").prefetch_related(
+            Prefetch("reviews", queryset=Review.objects.select_related("user"))
+        )
+    else:
+        products = Product.objects.only("id", "name", "image")
+    return Order.objects.prefetch_related(Prefetch("items__product", queryset=products))
+
+
+def order_serializer_class(expand):
+    return ExpandedOrderSerializer if expand else OrderSerializer
+
 
 # ---------------- ORDER LIST ----------------
 class OrderListAPIView(APIView):
@@ -27,18 +56,27 @@ class OrderListAPIView(APIView):
      
     @swagger_auto_schema(
         operation_summary="List Orders",
-        operation_description="List all orders for authenticated user or all orders if admin. Supports pagination.",
+        operation_description=(
+            "List all orders for authenticated user or all orders if admin. Supports pagination "
+            "(page numbers, or a cursor when ORDER_CURSOR_PAGINATION is on). "
+            "Order lines carry the product's id, name and image; "
+            "?expand=items.product embeds the full product instead."
+        ),
         responses={200: OrderSerializer(many=True)},
     )
     def get(self, request):
         user = request.user
-        qs = Order.objects.prefetch_related("items__product").order_by("-created_at")
+        expand = expands_products(request)
+        qs = orders_with_items(expand).order_by("-created_at")
         if not user.is_staff:
             qs = qs.filter(user=user)
 
-        paginator = OrderPagination()
+        if settings.ORDER_CURSOR_PAGINATION:
+            paginator = OrderCursorPagination()
+        else:
+            paginator = OrderPagination()
         result_page = paginator.paginate_queryset(qs, request)
-        serializer = OrderSerializer(result_page, many=True)
+        serializer = order_serializer_class(expand)(result_page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
@@ -49,16 +87,64 @@ class OrderDetailAPIView(APIView):
 
     @swagger_auto_schema(
         operation_summary="Order Detail",
-        operation_description="Retrieve details of a specific order by ID. Users can only access their own orders.",
+        operation_description=(
+            "Retrieve details of a specific order by ID. Users can only access their own orders. "
+            "?expand=items.product embeds the full product in each line."
+        ),
         responses={200: OrderSerializer()},
     )
     def get(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id)
+        expand = expands_products(request)
+        order = get_object_or_404(orders_with_items(expand), id=order_id)
         self.check_object_permissions(request, order)
-        serializer = OrderSerializer(order)
+        serializer = order_serializer_class(expand)(order)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+# ---------------- ORDER PAYMENT STATUS ----------------
+class OrderPaymentStatusAPIView(APIView):
+    """
+    Poll target for async checkout: tells whether the Paystack transaction
+    of an order has been initialized yet.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
+    throttle_classes = [ComboRateThrottle]
+
+    @swagger_auto_schema(
+        operation_summary="Order Payment Status",
+        operation_description=(
+            "Returns `pending` until payment initialization finishes, then "
+            "`ready` with the authorization URL, or `failed`."
+        ),
+        responses={200: "Payment status"},
+    )
+    def get(self, request, order_id):
+        order = get_object_or_404(Order.objects.select_related("user"), id=order_id)
+        self.check_object_permissions(request, order)
+
+        if order.payment_authorization_url:
+            payment_state = "ready"
+        elif order.payment_status == "pending":
+            payment_state = "pending"
+        else:
+            payment_state = order.payment_status
+
+        response = Response(
+            {
+                "order_id": order.id,
+                "reference": order.reference,
+                "status": payment_state,
+                "authorization_url": order.payment_authorization_url,
+                "access_code": order.payment_access_code,
+            },
+            status=status.HTTP_200_OK,
+        )
+        if payment_state == "pending":
+            response["Retry-After"] = "1"
+        return response
+
+
 # ---------------- PAYSTACK WEBHOOK ----------------
 class PaymentWebhookAPIView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -67,8 +153,11 @@ class PaymentWebhookAPIView(APIView):
 
     @swagger_auto_schema(
         operation_summary="Paystack Webhook",
-        operation_description="Verifies payment and triggers order processing.",
-        responses={200: "Webhook processed successfully"},
+        operation_description=(
+            "Verifies the signature, stores the event once (by event id) and "
+            "replies right away; the order is updated by a background worker."
+        ),
+        responses={200: "Event received"},
     )
     def post(self, request):
         #  Verify Paystack signature
@@ -96,47 +185,10 @@ class PaymentWebhookAPIView(APIView):
         if not reference or not reference.startswith("ORD-"):
             return Response({"error": "Invalid reference"}, status=400)
 
-        order_id = reference.replace("ORD-", "")
-
-        #  Atomic + row-lock for idempotency
-        with transaction.atomic():
-            order = Order.objects.select_for_update().filter(id=order_id).first()
-            if not order:
-                return Response({"message": "Order not found"}, status=200)
-
-            if order.payment_status == "paid":
-                return Response({"message": "Order already paid"}, status=200)
-
-            if payload.get("event") != "charge.success":
-                return Response({"message": "Ignoring non-success event"}, status=200)
-
-            # Mark order as paid
-            order.payment_status = "paid"
-            order.save(update_fields=["payment_status"])
-
-        # Create shipment snapshot (if missing)
-        if not hasattr(order, "order_shipment"):
-            Shipment.objects.create(
-                order=order,
-                shipping_full_name=order.shipping_full_name,
-                shipping_address_text=order.shipping_address_text,
-                shipping_city=order.shipping_city,
-                shipping_state=order.shipping_state,
-                shipping_country=order.shipping_country,
-                shipping_postal_code=order.shipping_postal_code,
-                shipping_phone=order.shipping_phone,
-                shipping_fee=order.shipping_cost,
-                delivery_status="pending",
-            )
-
-        #  Trigger Celery task (once)
-        process_order_after_payment.delay(
-            order_id=order.id,
-            user_email=order.user.email if order.user else None,
-            user_id=order.user.id if order.user else None,
-        )
+        # Store it and reply; the order is updated by process_payment_events
+        _, created = record_payment_event(payload, request.body)
+        if not created:
+            return Response({"message": "Event already received"}, status=200)
 
-        return Response(
-            {"message": "Payment verified. Order processing started."},
-            status=200,
-        )
+        transaction.on_commit(process_payment_events.delay)
+        return Response({"message": "Event received"}, status=200)
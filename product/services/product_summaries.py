@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from product.models import Product
+
+SUMMARY_FIELDS = ("id", "name", "slug", "image", "price", "stock", "is_active")
+
+
+def _cache_key(product_id):
+    return f"product-summary:{product_id}"
+
+
+def _summary(product):
+    return {
+        "id": product.id,
+        "name": product.name,
+        "slug": product.slug,
+        "image": product.image.url if product.image else None,
+        "price": float(product.price),
+        "stock": product.stock,
+        "is_active": product.is_active,
+    }
+
+
+def get_product_summaries(product_ids):
+    """
+    Small, cacheable view of several products (e.g. to render cart lines).
+    One cache round trip (MGET) for all ids, then one `id__in` query for
+    the misses, which are cached for PRODUCT_SUMMARY_TTL seconds.
+    Returns {product_id: summary}; unknown ids are left out.
+    """
+    product_ids = {str(pid) for pid in product_ids}
+    if not product_ids:
+        return {}
+
+    cached = cache.get_many([_cache_key(pid) for pid in product_ids])
+    summaries = {summary["id"]: summary for summary in cached.values()}
+
+    missing = product_ids - summaries.keys()
+    if missing:
+        fresh = {
+            product.id: _summary(product)
+            for product in Product.objects.filter(id__in=missing).only(*SUMMARY_FIELDS)
+        }
+        cache.set_many(
+            {_cache_key(pid): summary for pid, summary in fresh.items()},
+            timeout=settings.PRODUCT_SUMMARY_TTL,
+        )
+        summaries.update(fresh)
+    return summaries
+
+
+def invalidate_product_summaries(product_ids):
+    cache.delete_many([_cache_key(pid) for pid in product_ids])
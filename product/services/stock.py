@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from product.models import Product
+
+from .product_summaries import invalidate_product_summaries
+
+
+def decrement_stock(quantities):
+    """
+    Take {product_id: quantity} off Product.stock, inside the caller's
+    transaction, in two statements however many products there are:
+
+    - SELECT ... FOR UPDATE ORDER BY id locks the rows in product id order,
+      so concurrent orders sharing products queue instead of deadlocking
+    - one UPDATE ... SET stock = stock - CASE id WHEN ... END for all of them
+
+    Returns the ids without enough stock; then nothing is changed. Cached
+    product summaries are dropped after commit (update() sends no post_save).
+    """
+    if not quantities:
+        return []
+
+    stock = dict(
+        Product.objects.select_for_update()
+        .filter(id__in=quantities)
+        .order_by("id")
+        .values_list("id", "stock")
+    )
+    short = sorted(pid for pid, qty in quantities.items() if stock.get(pid, 0) < qty)
+    if short:
+        return short
+
+    Product.objects.filter(id__in=quantities).update(
+        stock=F("stock")
+        - Case(
+            *[When(id=pid, then=Value(qty)) for pid, qty in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    transaction.on_commit(lambda: invalidate_product_summaries(list(quantities)))
+    return []
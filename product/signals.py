@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product
+from .services.product_summaries import invalidate_product_summaries
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def drop_product_summary(sender, instance, **kwargs):
+    # After commit, so a concurrent read cannot cache the old row again
+    transaction.on_commit(lambda: invalidate_product_summaries([instance.id]))